@@ -0,0 +1,127 @@
+import json
+import os
+import threading
+
+from instrument import timed
+
+ATLAS_IMAGE = 'img/atlas.png'
+ATLAS_INDEX = 'img/atlas.json'
+ATLAS_VERSION = 1
+ATLAS_WIDTH = 2048
+SPRITE_DIRS = ['img/items/', 'img/counts/']
+
+def getSourceStamp(path):
+    stat = os.stat(path)
+
+    return [stat.st_mtime_ns, stat.st_size]
+
+class SpriteAtlas:
+    # The sheet is only decoded on first use, so creating an atlas at startup
+    # doesn't hold up the window
+    def __init__(self, image_path=ATLAS_IMAGE, index_path=ATLAS_INDEX):
+        self.image_path = image_path
+        self.index_path = index_path
+        self.sheet = None
+        self.boxes = {}
+        self.loaded = False
+        self.lock = threading.Lock()
+        self.disk_cache = None
+
+    @classmethod
+    def load(cls, image_path=ATLAS_IMAGE, index_path=ATLAS_INDEX):
+        return cls(image_path, index_path)
+
+    def ensureLoaded(self):
+        with self.lock:
+            if not self.loaded:
+                self.loaded = True
+                self.readAtlas()
+
+    def readAtlas(self):
+        from PIL import Image
+
+        try:
+            with open(self.index_path) as infile:
+                index = json.load(infile)
+            if index.get('version') != ATLAS_VERSION:
+                return
+            sheet = Image.open(self.image_path)
+            sheet.load()
+        except (OSError, ValueError):
+            # Missing or unreadable atlas, every sprite comes from its own file
+            return
+
+        for path, entry in index['sprites'].items():
+            try:
+                if getSourceStamp(path) != entry['stamp']:
+                    # The loose file changed after the atlas was built
+                    continue
+            except FileNotFoundError:
+                pass
+            self.boxes[path] = tuple(entry['box'])
+        self.sheet = sheet
+
+    def open(self, path):
+        if not self.loaded:
+            self.ensureLoaded()
+        box = self.boxes.get(path)
+        if box is None:
+            from PIL import Image
+            return Image.open(path)
+
+        return self.sheet.crop(box)
+
+    def resized(self, path, scale, resample=None):
+        from PIL import Image
+
+        if resample is None:
+            resample = Image.LANCZOS
+        if self.disk_cache is None:
+            with timed('render.open'):
+                img = self.open(path)
+            with timed('render.resize'):
+                return img.resize((scale, scale), resample)
+
+        return self.disk_cache.resized(path, scale, resample, Image.LANCZOS)
+
+    def __len__(self):
+        self.ensureLoaded()
+
+        return len(self.boxes)
+
+def findSprites():
+    sprites = []
+    for sprite_dir in SPRITE_DIRS:
+        for filename in sorted(os.listdir(sprite_dir)):
+            if filename.endswith('.png'):
+                sprites.append(f'{sprite_dir}{filename}')
+
+    return sprites
+
+def buildAtlas(image_path=ATLAS_IMAGE, index_path=ATLAS_INDEX):
+    from PIL import Image
+
+    images = [(path, Image.open(path).convert('RGBA')) for path in findSprites()]
+    # Simple shelf packing, tallest sprites first
+    images.sort(key=lambda entry: entry[1].height, reverse=True)
+
+    placements = []
+    (x, y, shelf_height) = (0, 0, 0)
+    for path, img in images:
+        if x + img.width > ATLAS_WIDTH:
+            (x, y, shelf_height) = (0, y + shelf_height, 0)
+        placements.append((path, img, (x, y, x + img.width, y + img.height)))
+        x += img.width
+        shelf_height = max(shelf_height, img.height)
+
+    sheet = Image.new('RGBA', (ATLAS_WIDTH, y + shelf_height))
+    sprites = {}
+    for path, img, box in placements:
+        sheet.paste(img, box[:2])
+        sprites[path] = { 'box': box, 'stamp': getSourceStamp(path) }
+
+    sheet.save(image_path)
+    with open(index_path, 'w') as outfile:
+        json.dump({ 'version': ATLAS_VERSION, 'sprites': sprites }, outfile, indent=4)
+
+    return len(sprites)
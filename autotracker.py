@@ -0,0 +1,159 @@
+import json
+import os
+import queue
+import threading
+
+POLL_INTERVAL = 0.1
+
+class AutoTrackerError(ValueError):
+    pass
+
+def parseNumber(value):
+    # Addresses and masks may be written as hex strings in the config
+    if isinstance(value, str):
+        return int(value, 0)
+
+    return value
+
+class Watch:
+    def __init__(self, entry):
+        try:
+            self.address = parseNumber(entry['address'])
+            self.name = entry['name']
+            self.size = entry.get('size', 1)
+            self.itemText = entry.get('itemText')
+            self.mask = parseNumber(entry['mask']) if 'mask' in entry else None
+            self.states = { int(key, 0): value for key, value in entry.get('states', {}).items() }
+        except (KeyError, TypeError, ValueError, AttributeError) as error:
+            raise AutoTrackerError(f'Invalid auto-tracker entry {entry}: {error}')
+        numbers = [self.address, self.size] + ([self.mask] if self.mask is not None else [])
+        if any(type(number) is not int or number < 0 for number in numbers) or not self.size or \
+           any(type(value) is not int for value in self.states.values()):
+            raise AutoTrackerError(f'Invalid auto-tracker entry {entry}: addresses, sizes, masks and '
+                                   'states must be whole numbers')
+
+    def matches(self, item):
+        return getItemKey(item) == self.name and (self.itemText is None or item.itemText == self.itemText)
+
+    def getValue(self, raw, item):
+        # Map a raw memory value onto the item's state index or count
+        if self.mask is not None:
+            value = 1 if raw & self.mask else 0
+        elif self.states:
+            value = self.states.get(raw)
+            if value is None:
+                return None
+        else:
+            value = raw
+
+        return max(0, min(value, item.state_count() - 1))
+
+def getItemKey(item):
+    # Progressive items are named after their first state, since their name
+    # follows whatever state they were created in
+    states = getattr(item, 'states', None)
+
+    return states[0] if states else item.name
+
+def mergeRanges(watches):
+    # Contiguous or overlapping watched bytes are read as one range
+    ranges = []
+    for watch in sorted(watches, key=lambda watch: watch.address):
+        (start, end) = (watch.address, watch.address + watch.size)
+        if ranges and start <= ranges[-1][1]:
+            ranges[-1][1] = max(ranges[-1][1], end)
+        else:
+            ranges.append([start, end])
+
+    return ranges
+
+def loadAutoTrackerConfig(path):
+    try:
+        with open(path) as infile:
+            data = json.load(infile)
+    except (OSError, ValueError) as error:
+        raise AutoTrackerError(f'Could not read auto-tracker config {path}: {error}')
+
+    if not isinstance(data, dict) or not isinstance(data.get('Addresses', []), list):
+        raise AutoTrackerError(f'{path} must be an object with a list of Addresses')
+    watches = [Watch(entry) for entry in data.get('Addresses', [])]
+
+    return (data.get('DumpFile', 'memory.bin'), data.get('PollInterval', POLL_INTERVAL), watches)
+
+class AutoTracker:
+    # Polls the dump file on a background thread and queues the watched
+    # addresses that changed; the Tk thread drains the queue in batches
+    def __init__(self, dump_path, watches, poll_interval=POLL_INTERVAL):
+        self.dump_path = dump_path
+        self.watches = watches
+        self.poll_interval = poll_interval
+        self.ranges = mergeRanges(watches)
+        self.previous = {}
+        self.stamp = None
+        self.changes = queue.SimpleQueue()
+        self.stopped = threading.Event()
+        self.thread = threading.Thread(target=self.run, daemon=True)
+
+    def start(self):
+        self.thread.start()
+
+    def stop(self):
+        self.stopped.set()
+
+    def run(self):
+        while not self.stopped.is_set():
+            changed = self.poll()
+            if changed:
+                self.changes.put(changed)
+            self.stopped.wait(self.poll_interval)
+
+    def poll(self):
+        try:
+            stat = os.stat(self.dump_path)
+        except FileNotFoundError:
+            return None
+        stamp = (stat.st_mtime_ns, stat.st_size)
+        if stamp == self.stamp:
+            return None
+        self.stamp = stamp
+
+        # Plain reads rather than a memory map: touching a mapped page after
+        # another process truncates the file raises SIGBUS, which kills the
+        # whole tracker
+        changed_ranges = []
+        try:
+            with open(self.dump_path, 'rb') as infile:
+                for (start, end) in self.ranges:
+                    infile.seek(start)
+                    current = infile.read(end - start)
+                    if len(current) < end - start:
+                        # Cut short while the emulator rewrites it, look again next poll
+                        self.stamp = None
+                        continue
+                    if current != self.previous.get(start):
+                        self.previous[start] = current
+                        changed_ranges.append(start)
+        except OSError:
+            # Vanished file while the emulator rewrites it
+            return None
+        if not changed_ranges:
+            return None
+
+        values = {}
+        for watch in self.watches:
+            for start in changed_ranges:
+                data = self.previous[start]
+                offset = watch.address - start
+                if 0 <= offset and offset + watch.size <= len(data):
+                    values[watch] = int.from_bytes(data[offset:offset + watch.size], 'little')
+
+        return values
+
+    def takeChanges(self):
+        # Everything queued since the last call, newest value per watch wins
+        merged = {}
+        while True:
+            try:
+                merged.update(self.changes.get_nowait())
+            except queue.Empty:
+                return merged
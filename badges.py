@@ -0,0 +1,174 @@
+import math
+import threading
+
+COUNTS_DIR = 'img/counts/'
+SOURCE_SIZE = 120
+BADGE_COLOR = (0, 0, 0, 255)
+COUNT_COLOR = (255, 255, 255, 255)
+MAX_COLOR = (0, 255, 0, 255)
+MAX_SUFFIX = 'max'
+# Where glyphs are searched for inside a badge, which keeps the stray pixels
+# along the edges of the source PNGs out of them
+GLYPH_MARGIN = 2
+GLYPH_ATLAS_LIMIT = 64
+GLYPH_PADDING = 4
+
+def getBadgeName(count, max_num=None):
+    # The badge for a count, or for a maxed out item when count is -1
+    if not count:
+        return None
+    if count == -1:
+        return f'{max_num}{MAX_SUFFIX}'
+
+    return str(count)
+
+class GlyphSource:
+    # Digit glyphs and badge metrics at source resolution, taken from the
+    # hand-made count PNGs. Single digits use a larger font than numbers with
+    # more digits, so there are two glyph sets: 1.png to 9.png for the large
+    # one, and the right digit of 10.png to 19.png for the small one. The PNGs
+    # center each digit in a fixed width cell, with the cells centered on the
+    # badge.
+    def __init__(self, atlas):
+        reference = atlas.open(f'{COUNTS_DIR}1.png').convert('RGBA')
+        self.badge_box = reference.getchannel('A').getbbox()
+        self.large = {}
+        self.small = {}
+        for digit in range(10):
+            if digit:
+                ((glyph, _),) = self.findGlyphs(atlas, str(digit))
+                self.large[str(digit)] = glyph
+            ((_, left), (glyph, right)) = self.findGlyphs(atlas, f'1{digit}')
+            self.small[str(digit)] = glyph
+        # Zero never shows on its own, but a large one keeps the sets alike
+        self.large['0'] = self.small['0']
+        self.advance = right - left
+        (left, top, right, bottom) = self.badge_box
+        self.center = ((left + right) / 2, (top + bottom) / 2)
+        self.glyph_width = max(mask.width for mask, _ in self.small.values())
+
+    def findGlyphs(self, atlas, name):
+        # Returns (mask, top), center x for every digit in a count badge
+        from PIL import ImageChops
+
+        img = atlas.open(f'{COUNTS_DIR}{name}.png').convert('RGBA')
+        (left, top, right, bottom) = self.badge_box
+        area = (left + GLYPH_MARGIN, top + GLYPH_MARGIN, right - GLYPH_MARGIN, bottom - GLYPH_MARGIN)
+        # Counts are white and maxed out counts green, take the brightest band
+        (red, green, blue) = img.crop(area).convert('RGB').split()
+        coverage = ImageChops.lighter(ImageChops.lighter(red, green), blue)
+        columns = [any(coverage.getpixel((x, y)) for y in range(coverage.height))
+                   for x in range(coverage.width)]
+
+        glyphs = []
+        x = 0
+        while x < len(columns):
+            if not columns[x]:
+                x += 1
+                continue
+            start = x
+            while x < len(columns) and columns[x]:
+                x += 1
+            box = coverage.crop((start, 0, x, coverage.height)).getbbox()
+            mask = coverage.crop((start, box[1], x, box[3]))
+            glyphs.append(((mask, area[1] + box[1]), area[0] + (start + x) / 2))
+
+        return glyphs
+
+class GlyphAtlas:
+    # The digit glyphs for numbers of one length at one scale. Every glyph is
+    # resampled straight onto the target pixel grid from its exact position
+    # in the source badge, so a composed badge matches resizing a whole PNG.
+    def __init__(self, source, length, scale, resample):
+        self.source = source
+        self.length = length
+        self.factor = scale / SOURCE_SIZE
+        self.resample = resample
+        self.glyphs = source.large if length == 1 else source.small
+        # Numbers wider than two digits get smaller glyphs so they still fit
+        needed = (length - 1) * source.advance + source.glyph_width
+        self.fit = min(1, (source.advance + source.glyph_width) / needed)
+        self.masks = {}
+
+    def getGlyph(self, slot, digit):
+        key = (slot, digit)
+        glyph = self.masks.get(key)
+        if glyph is None:
+            glyph = self.placeGlyph(slot, digit)
+            self.masks[key] = glyph
+
+        return glyph
+
+    def placeGlyph(self, slot, digit):
+        from PIL import Image
+
+        (mask, top) = self.glyphs[digit]
+        (center_x, center_y) = self.source.center
+        (fit, factor) = (self.fit, self.factor)
+        offset = (slot - (self.length - 1) / 2) * self.source.advance * fit
+        left = center_x + offset - mask.width * fit / 2
+        top = center_y + (top - center_y) * fit
+
+        # The target pixels the glyph touches, and the matching source region
+        # of the mask, padded so the region can reach past its edges
+        x0 = math.floor(left * factor)
+        y0 = math.floor(top * factor)
+        x1 = math.ceil((left + mask.width * fit) * factor)
+        y1 = math.ceil((top + mask.height * fit) * factor)
+        padded = Image.new('L', (mask.width + 2 * GLYPH_PADDING, mask.height + 2 * GLYPH_PADDING))
+        padded.paste(mask, (GLYPH_PADDING, GLYPH_PADDING))
+        box = ((x0 / factor - left) / fit + GLYPH_PADDING, (y0 / factor - top) / fit + GLYPH_PADDING,
+               (x1 / factor - left) / fit + GLYPH_PADDING, (y1 / factor - top) / fit + GLYPH_PADDING)
+        box = (max(0, box[0]), max(0, box[1]), min(padded.width, box[2]), min(padded.height, box[3]))
+
+        return (padded.resize((max(1, x1 - x0), max(1, y1 - y0)), self.resample, box), (x0, y0))
+
+class BadgeRenderer:
+    def __init__(self):
+        self.source = None
+        self.atlases = {}
+        self.lock = threading.Lock()
+
+    def getSource(self, atlas):
+        with self.lock:
+            if self.source is None:
+                self.source = GlyphSource(atlas)
+
+        return self.source
+
+    def getGlyphAtlas(self, source, length, scale, resample):
+        key = (length, scale, resample)
+        with self.lock:
+            glyph_atlas = self.atlases.get(key)
+            if glyph_atlas is None:
+                if len(self.atlases) >= GLYPH_ATLAS_LIMIT:
+                    self.atlases.clear()
+                glyph_atlas = GlyphAtlas(source, length, scale, resample)
+                self.atlases[key] = glyph_atlas
+
+        return glyph_atlas
+
+    def render(self, atlas, name, scale, resample=None):
+        from PIL import Image
+
+        if resample is None:
+            resample = Image.LANCZOS
+        source = self.getSource(atlas)
+        if name.endswith(MAX_SUFFIX):
+            (digits, color) = (name[:-len(MAX_SUFFIX)], MAX_COLOR)
+        else:
+            (digits, color) = (name, COUNT_COLOR)
+        glyph_atlas = self.getGlyphAtlas(source, len(digits), scale, resample)
+
+        badge = Image.new('RGBA', (scale, scale))
+        badge.paste(BADGE_COLOR, tuple(round(edge * glyph_atlas.factor) for edge in source.badge_box))
+        for slot, digit in enumerate(digits):
+            (mask, position) = glyph_atlas.getGlyph(slot, digit)
+            badge.paste(color, position, mask)
+
+        return badge
+
+BADGES = BadgeRenderer()
+
+def renderBadge(atlas, name, scale, resample=None):
+    return BADGES.render(atlas, name, scale, resample)
@@ -0,0 +1,76 @@
+#!/usr/bin/env python
+
+# Checks that the batched NumPy compositing path produces exactly the same
+# pixels as rendering each variant with PIL, and compares their timings.
+#
+#   $ python benchmarks/composite_check.py
+
+import os
+import sys
+import time
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT_DIR)
+os.chdir(ROOT_DIR)
+
+import composite
+from atlas import SpriteAtlas
+from badges import getBadgeName
+from composite import renderItemBatch, groupRenderKeys
+from items import getHardcodedDefaults
+from render import renderItemImage
+
+SCALES = [10, 37, 60, 120]
+
+def getRenderKeys(scale):
+    keys = []
+    for row in getHardcodedDefaults():
+        for item in row:
+            variant = item.detach()
+            for _ in range(variant.state_count()):
+                badge = None
+                if hasattr(variant, 'max_num'):
+                    badge = getBadgeName(variant.current_num if variant.isNotMaxed() else -1, variant.max_num)
+                keys.append((variant.get_image_path(), scale, badge, variant.isDark()))
+                variant.next_state()
+
+    return keys
+
+def main():
+    if composite.numpy is None:
+        print('NumPy is not installed, the batched path falls back to PIL')
+        return 1
+
+    atlas = SpriteAtlas.load()
+    mismatches = 0
+    for scale in SCALES:
+        groups = groupRenderKeys(getRenderKeys(scale))
+
+        start = time.perf_counter()
+        expected = {}
+        for (filepath, _), variants in groups.items():
+            for badge, isDark in variants:
+                expected[(filepath, badge, isDark)] = renderItemImage(atlas, filepath, scale, badge, isDark)
+        single_time = time.perf_counter() - start
+
+        start = time.perf_counter()
+        actual = {}
+        for (filepath, _), variants in groups.items():
+            images = renderItemBatch(atlas, filepath, scale, variants)
+            for (badge, isDark), img in zip(variants, images):
+                actual[(filepath, badge, isDark)] = img
+        batch_time = time.perf_counter() - start
+
+        for key, img in expected.items():
+            if img.tobytes() != actual[key].tobytes() or img.mode != actual[key].mode:
+                print(f'Mismatch at {scale}px: {key}')
+                mismatches += 1
+        print(f'{scale:>4}px  {len(expected)} images  PIL {single_time * 1000:.1f} ms  '
+              + f'batched {batch_time * 1000:.1f} ms')
+
+    print('All pixels match' if not mismatches else f'{mismatches} mismatched images')
+
+    return 1 if mismatches else 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,101 @@
+# The item classes and State as they were before the array-backed rewrite,
+# kept only so the benchmarks have something to compare against
+import copy
+
+ITEM_DIR = 'img/items/'
+
+class Item:
+    def __init__(self, name, itemText=''):
+        self.name = name
+        self.itemText = itemText
+
+    def next_state(self):
+        pass
+
+    def get_image_path(self):
+        return f'{ITEM_DIR}{self.name}.png'
+
+class ProgressiveItem(Item):
+    def __init__(self, states, current_state=0, itemText=''):
+        self.states = states
+        self.current_state = current_state
+        super().__init__(states[self.current_state], itemText)
+
+    def next_state(self):
+        self.current_state = (self.current_state + 1) % len(self.states)
+
+class ToggleItem(ProgressiveItem):
+    def __init__(self, name, current_state=0, itemText=''):
+        super().__init__([name,name], current_state, itemText)
+        self.name = name
+
+class NumberedItem(Item):
+    def __init__(self, name, max_num, current_num=0, itemText=''):
+        super().__init__(name, itemText)
+        self.max_num = max_num
+        self.current_num = current_num
+
+    def next_state(self):
+        self.current_num = (self.current_num + 1) % (self.max_num + 1)
+
+class State:
+    def __init__(self, defaults):
+        self.defaults = defaults
+        self.reset()
+
+    def reset(self):
+        self.items = copy.deepcopy(self.defaults)
+
+    def fullWipe(self):
+        for row in self.items:
+            for item in row:
+                if isinstance(item, ProgressiveItem) or isinstance(item, ToggleItem):
+                    item.current_state = 0
+                elif isinstance(item, NumberedItem):
+                    item.current_num = 0
+
+    def snapshot(self):
+        return copy.deepcopy(self.items)
+
+def convertItems(items):
+    # Build legacy items with the same layout and values as the given ones
+    legacy_items = []
+    for row in items:
+        legacy_row = []
+        for item in row:
+            state = item.get_json_state()
+            if state['type'] == 'ProgressiveItem':
+                legacy_item = ProgressiveItem(list(state['states']), state['current_state'], state['itemText'])
+            elif state['type'] == 'ToggleItem':
+                legacy_item = ToggleItem(state['name'], state['current_state'], state['itemText'])
+            elif state['type'] == 'NumberedItem':
+                legacy_item = NumberedItem(state['name'], state['max_num'], state['current_num'],
+                                           state['itemText'])
+            else:
+                legacy_item = Item(state['name'], state['itemText'])
+            legacy_row.append(legacy_item)
+        legacy_items.append(legacy_row)
+
+    return legacy_items
+
+def loadItems(json_state):
+    # The template loader as it was, one if/elif per cell followed by a deepcopy
+    # of the whole layout in State.updateItems
+    items = []
+    for row in json_state:
+        item_row = []
+        for item_state in row:
+            item_type = item_state['type']
+            if item_type == 'Item':
+                item = Item(item_state['name'], item_state['itemText'])
+            elif item_type == 'ProgressiveItem':
+                item = ProgressiveItem(item_state['states'], item_state['current_state'], item_state['itemText'])
+            elif item_type == 'ToggleItem':
+                item = ToggleItem(item_state['name'], item_state['current_state'], item_state['itemText'])
+            elif item_type == 'NumberedItem':
+                item = NumberedItem(item_state['name'], item_state['max_num'], item_state['current_num'],
+                                    item_state['itemText'])
+            item_row.append(item)
+        items.append(item_row)
+
+    return copy.deepcopy(items)
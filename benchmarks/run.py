@@ -0,0 +1,254 @@
+#!/usr/bin/env python
+
+# Latency benchmarks for the render, state and serialization hot paths.
+#
+#   $ python benchmarks/run.py                  # run and compare to the baseline
+#   $ python benchmarks/run.py --save-baseline  # run and store a new baseline
+#   $ python benchmarks/run.py render state     # only the matching benchmarks
+#
+# Benchmarks that need Tk are skipped when no display is available.
+
+import argparse
+import itertools
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT_DIR)
+os.chdir(ROOT_DIR)
+
+from atlas import SpriteAtlas
+from benchmarks import legacy
+from items import getHardcodedDefaults, convertJSONtoItems
+from recording import Recorder, RunReader
+from render import renderItemImage
+from spritecache import SpriteDiskCache
+from stateformat import loadStateFile, saveStateFile
+from tracker import State, Tracker
+
+BASELINE_FILE = os.path.join('benchmarks', 'baseline.json')
+REGRESSION_THRESHOLD = 1.25
+SCALES = [10, 30, 60, 120]
+LAYOUTS = [(1, 1), (4, 4), (10, 10)]
+TEMPLATE_LAYOUTS = [(10, 10), (20, 30)]
+SAMPLES = 200
+RUN_HOURS = 4
+RUN_EVENT_SECONDS = 3
+
+def makeLayout(row_repeat, column_repeat):
+    # Tile the default 9x6 layout into a larger synthetic one
+    defaults = getHardcodedDefaults()
+    layout = []
+    for _ in range(row_repeat):
+        for row in defaults:
+            layout.append([item for _ in range(column_repeat) for item in row])
+
+    return layout
+
+def layoutName(layout):
+    return f'{len(layout)}x{len(layout[0])}'
+
+def measure(operation, samples=SAMPLES):
+    timings = []
+    for _ in range(samples):
+        start = time.perf_counter()
+        operation()
+        timings.append(time.perf_counter() - start)
+
+    return timings
+
+def percentiles(timings):
+    timings = sorted(timings)
+
+    def at(fraction):
+        return timings[min(len(timings) - 1, int(fraction * len(timings)))] * 1e6
+
+    return { 'p50': at(0.50), 'p90': at(0.90), 'p99': at(0.99), 'max': timings[-1] * 1e6 }
+
+def renderBenchmarks():
+    atlas = SpriteAtlas.load()
+    variants = [
+                ('plain', 'img/items/bow.png', None, False),
+                ('dark', 'img/items/bow.png', None, True),
+                ('count', 'img/items/soul.png', '30', False),
+                ('count-max-dark', 'img/items/soul.png', '60max', True)
+               ]
+    for scale in SCALES:
+        for name, filepath, badge, isDark in variants:
+            yield (f'render/{scale}px/{name}',
+                   lambda f=filepath, s=scale, o=badge, d=isDark: renderItemImage(atlas, f, s, o, d))
+
+    # The same renders served from a warm on-disk sprite cache
+    cached_atlas = SpriteAtlas.load()
+    cached_atlas.disk_cache = SpriteDiskCache(cached_atlas, tempfile.mkdtemp(prefix='midna-bench-'))
+    for scale in SCALES:
+        for name, filepath, badge, isDark in variants:
+            yield (f'render/{scale}px/{name}/disk-cache',
+                   lambda f=filepath, s=scale, o=badge, d=isDark: renderItemImage(cached_atlas, f, s, o, d))
+
+def stateBenchmarks():
+    for repeat in LAYOUTS:
+        layout = makeLayout(*repeat)
+        name = layoutName(layout)
+        state = State(layout)
+        json_items = state.serializeState()['items']
+        yield (f'state/{name}/serializeState', state.serializeState)
+        yield (f'state/{name}/convertJSONtoItems', lambda j=json_items: convertJSONtoItems(j))
+        yield (f'state/{name}/reset', state.reset)
+        yield (f'state/{name}/fullWipe', state.fullWipe)
+
+def templateBenchmarks():
+    template_dir = tempfile.mkdtemp(prefix='midna-bench-')
+    for repeat in TEMPLATE_LAYOUTS:
+        layout = makeLayout(*repeat)
+        name = layoutName(layout)
+        json_items = State(layout).serializeState()['items']
+        state = State(layout)
+        yield (f'template/{name}/updateItems', lambda s=state, j=json_items: s.updateItems(j))
+        yield (f'template/{name}/legacy', lambda j=json_items: legacy.loadItems(j))
+
+        # The whole load, parsing the file included
+        for extension in ('json', 'midna'):
+            path = os.path.join(template_dir, f'{name}.{extension}')
+            saveStateFile(path, { 'items': json_items })
+            yield (f'template/{name}/load/{extension}',
+                   lambda s=state, p=path: s.updateItems(loadStateFile(p)['items']))
+
+    # Rows can be empty, the first one included
+    json_items = [[]] + State(makeLayout(1, 1)).serializeState()['items']
+    state = State(convertJSONtoItems(json_items))
+    yield ('template/empty-first-row/updateItems', lambda s=state, j=json_items: s.updateItems(j))
+
+class ScriptedRecorder(Recorder):
+    # Records on a made up clock, so hours of play take no time to generate
+    now = 0
+
+    def elapsed(self):
+        return self.now
+
+def makeRun(layout, path):
+    state = State(layout)
+    recorder = ScriptedRecorder(state, path)
+    recorder.start()
+    cells = [(x, y) for y in range(len(layout)) for x in range(len(layout[y]))]
+    rng = random.Random(0)
+    for second in range(0, RUN_HOURS * 3600, RUN_EVENT_SECONDS):
+        recorder.now = second * 1000
+        (x, y) = rng.choice(cells)
+        item = state.items[y][x]
+        item.next_state()
+        recorder.recordValue(x, y, item.value)
+    recorder.close()
+
+def replayBenchmarks():
+    run_dir = tempfile.mkdtemp(prefix='midna-bench-')
+    for repeat in LAYOUTS:
+        layout = makeLayout(*repeat)
+        name = layoutName(layout)
+        path = os.path.join(run_dir, f'{name}.midnarun')
+        makeRun(layout, path)
+        reader = RunReader(path)
+        state = State(layout)
+        rng = random.Random(0)
+
+        # Random seeks load a keyframe, while playing forward a second at a
+        # time mostly replays just the new events
+        playhead = itertools.count(0, 1000)
+        yield (f'replay/{name}/seek', lambda r=reader, s=state, g=rng: r.seek(s, g.randrange(r.duration)))
+        yield (f'replay/{name}/seekForward',
+               lambda r=reader, s=state, p=playhead: r.seek(s, next(p) % r.duration))
+        yield (f'replay/{name}/open', lambda p=path: RunReader(p))
+
+def createTracker(layout):
+    from tkinter import Tk, TclError
+
+    try:
+        root = Tk()
+    except TclError:
+        return None
+    root.withdraw()
+    with open('config.json') as infile:
+        config = json.load(infile)
+    config['Autosave'] = False
+    config['RecordRuns'] = False
+
+    tracker = Tracker(root, State(layout), config)
+    tracker.build()
+    tracker.repaint.flush()
+
+    return tracker
+
+def trackerBenchmarks():
+    for repeat in LAYOUTS:
+        layout = makeLayout(*repeat)
+        tracker = createTracker(layout)
+        if tracker is None:
+            print('No display available, skipping Tracker benchmarks')
+            return
+        name = layoutName(layout)
+        cells = [(x, y) for y in range(len(layout)) for x in range(len(layout[y]))]
+        rng = random.Random(0)
+
+        def click(tracker=tracker, cells=cells, rng=rng):
+            tracker.forwardState(*rng.choice(cells))
+            tracker.repaint.flush()
+            tracker.root.update_idletasks()
+
+        yield (f'tracker/{name}/clickStorm', click)
+        yield (f'tracker/{name}/paintAllCells', tracker.paintAllCells)
+        for scale in SCALES:
+            def construct(tracker=tracker, scale=scale):
+                tracker.image_scale.set(scale)
+                tracker.constructImage('img/items/soul.png', 1, 8, 30, True)
+
+            yield (f'tracker/{name}/constructImage/{scale}px', construct)
+
+def loadBaseline():
+    try:
+        with open(BASELINE_FILE) as infile:
+            return json.load(infile)
+    except FileNotFoundError:
+        return {}
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark midna hot paths')
+    parser.add_argument('filters', nargs='*', help='only run benchmarks containing one of these')
+    parser.add_argument('--samples', type=int, default=SAMPLES)
+    parser.add_argument('--save-baseline', action='store_true')
+    args = parser.parse_args()
+
+    baseline = loadBaseline()
+    results = {}
+    regressions = 0
+
+    print(f'{"benchmark":<48}{"p50":>10}{"p90":>10}{"p99":>10}{"max":>10}  (us)')
+    for suite in (renderBenchmarks, stateBenchmarks, templateBenchmarks, replayBenchmarks, trackerBenchmarks):
+        for name, operation in suite():
+            if args.filters and not any(f in name for f in args.filters):
+                continue
+            result = percentiles(measure(operation, args.samples))
+            results[name] = result
+
+            line = f'{name:<48}' + ''.join(f'{result[key]:>10.1f}' for key in ('p50', 'p90', 'p99', 'max'))
+            if name in baseline:
+                ratio = result['p50'] / baseline[name]['p50']
+                line += f'  {ratio:>5.2f}x baseline'
+                if ratio > REGRESSION_THRESHOLD:
+                    line += '  REGRESSION'
+                    regressions += 1
+            print(line)
+
+    if args.save_baseline:
+        baseline.update(results)
+        with open(BASELINE_FILE, 'w') as outfile:
+            json.dump(baseline, outfile, indent=4)
+        print(f'Saved baseline to {BASELINE_FILE}')
+
+    return 1 if regressions else 0
+
+if __name__ == '__main__':
+    sys.exit(main())
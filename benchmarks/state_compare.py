@@ -0,0 +1,59 @@
+#!/usr/bin/env python
+
+# Compares memory use and reset/wipe/snapshot timings of the array-backed State
+# against the previous deepcopy-based classes.
+#
+#   $ python benchmarks/state_compare.py [repeat]
+
+import os
+import sys
+import timeit
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import legacy
+from items import getHardcodedDefaults
+from tracker import State
+
+LAYOUT_REPEATS = [1, 10, 100]
+
+def makeLayout(repeat):
+    defaults = getHardcodedDefaults()
+
+    return [row for _ in range(repeat) for row in defaults]
+
+def measureMemory(build):
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    state = build()
+    after = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+
+    return (state, after - before)
+
+def timeOperation(operation, number):
+    return min(timeit.repeat(operation, number=number, repeat=5)) / number * 1e6
+
+def compare(repeat):
+    layout = makeLayout(repeat)
+    (state, state_bytes) = measureMemory(lambda: State(layout))
+    (legacy_state, legacy_bytes) = measureMemory(lambda: legacy.State(legacy.convertItems(layout)))
+
+    cells = sum(len(row) for row in layout)
+    number = max(1, 1000 // repeat)
+    print(f'{cells} cells')
+    print(f'    {"":<12}{"current":>14}{"legacy":>14}')
+    print(f'    {"memory":<12}{state_bytes / 1024:>11.1f} KB{legacy_bytes / 1024:>11.1f} KB')
+    for name in ['reset', 'fullWipe', 'snapshot']:
+        current = timeOperation(getattr(state, name), number)
+        previous = timeOperation(getattr(legacy_state, name), number)
+        print(f'    {name:<12}{current:>11.1f} us{previous:>11.1f} us')
+
+def main():
+    repeats = [int(arg) for arg in sys.argv[1:]] or LAYOUT_REPEATS
+    for repeat in repeats:
+        compare(repeat)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,146 @@
+#!/usr/bin/env python
+
+# Measures how memory and paint time grow with the layout size for each
+# renderer. The virtual grid should stay flat, since it only materializes the
+# cells in its viewport.
+#
+#   $ python benchmarks/virtual_grid.py
+#   $ python benchmarks/virtual_grid.py --renderers canvas virtual
+#
+# Every measurement runs in its own process so resident memory isn't shared
+# between layouts. Needs a display; without one it starts Xvfb if that is
+# installed, so it also runs on a headless machine.
+
+import argparse
+import shutil
+import json
+import os
+import subprocess
+import sys
+import time
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT_DIR)
+os.chdir(ROOT_DIR)
+
+RENDERERS = ['buttons', 'canvas', 'virtual']
+LAYOUTS = [(1, 1), (2, 4), (5, 8), (10, 10)]
+SAMPLES = 20
+
+XVFB_DISPLAY = ':99'
+XVFB_START_SECONDS = 5
+
+def startXvfb():
+    # A private X server for the children, or None when there is none to start
+    xvfb = shutil.which('Xvfb')
+    if xvfb is None:
+        return None
+    server = subprocess.Popen([xvfb, XVFB_DISPLAY, '-screen', '0', '1920x1080x24', '-nolisten', 'tcp'],
+                              stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    socket_path = f'/tmp/.X11-unix/X{XVFB_DISPLAY[1:]}'
+    deadline = time.monotonic() + XVFB_START_SECONDS
+    while not os.path.exists(socket_path):
+        if server.poll() is not None or time.monotonic() > deadline:
+            server.kill()
+            return None
+        time.sleep(0.05)
+    os.environ['DISPLAY'] = XVFB_DISPLAY
+
+    return server
+
+def getResidentMB():
+    try:
+        with open('/proc/self/statm') as infile:
+            pages = int(infile.read().split()[1])
+        return pages * os.sysconf('SC_PAGE_SIZE') / (1024 * 1024)
+    except (OSError, ValueError):
+        import resource
+
+        # Peak rather than current, and in KB on Linux but bytes on macOS
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak / (1024 * 1024) if sys.platform == 'darwin' else peak / 1024
+
+def measureChild(renderer, row_repeat, column_repeat, samples):
+    from tkinter import Tk, TclError
+
+    from benchmarks.run import makeLayout
+    from tracker import State, Tracker
+
+    try:
+        root = Tk()
+    except TclError:
+        return None
+    layout = makeLayout(row_repeat, column_repeat)
+    with open('config.json') as infile:
+        config = json.load(infile)
+    config['Autosave'] = False
+    config['RecordRuns'] = False
+    config['Renderer'] = renderer
+
+    before = getResidentMB()
+    start = time.perf_counter()
+    tracker = Tracker(root, State(layout), config)
+    tracker.build()
+    tracker.repaint.flush()
+    root.update()
+    build_ms = (time.perf_counter() - start) * 1000
+
+    timings = []
+    for _ in range(samples):
+        start = time.perf_counter()
+        tracker.paintAllCells()
+        root.update_idletasks()
+        timings.append(time.perf_counter() - start)
+    timings.sort()
+
+    canvas = getattr(tracker.item_grid, 'canvas', None)
+    result = {
+              'cells': sum(len(row) for row in layout),
+              'widgets': tracker.countWidgets(),
+              'canvas_items': len(canvas.find_all()) if canvas is not None else 0,
+              'build_ms': build_ms,
+              'paint_ms': timings[len(timings) // 2] * 1000,
+              'memory_mb': getResidentMB() - before
+             }
+    root.destroy()
+
+    return result
+
+def compareRenderers(args):
+    print(f'{"renderer":<10}{"cells":>8}{"widgets":>9}{"items":>8}{"build ms":>10}'
+          f'{"paint ms":>10}{"memory MB":>11}')
+    for renderer in args.renderers:
+        for row_repeat, column_repeat in LAYOUTS:
+            output = subprocess.run([sys.executable, os.path.abspath(__file__), '--samples', str(args.samples),
+                                     '--child', renderer, str(row_repeat), str(column_repeat)],
+                                    capture_output=True, text=True, check=True).stdout
+            result = json.loads(output.strip().splitlines()[-1])
+            if result is None:
+                print('No display available, set DISPLAY or install Xvfb')
+                return 1
+            print(f'{renderer:<10}{result["cells"]:>8}{result["widgets"]:>9}{result["canvas_items"]:>8}'
+                  f'{result["build_ms"]:>10.1f}{result["paint_ms"]:>10.2f}{result["memory_mb"]:>11.1f}')
+
+    return 0
+
+def main():
+    parser = argparse.ArgumentParser(description='Compare renderers on growing layouts')
+    parser.add_argument('--renderers', nargs='*', default=RENDERERS)
+    parser.add_argument('--samples', type=int, default=SAMPLES)
+    parser.add_argument('--child', nargs=3, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        (renderer, row_repeat, column_repeat) = args.child
+        print(json.dumps(measureChild(renderer, int(row_repeat), int(column_repeat), args.samples)))
+        return 0
+
+    server = startXvfb() if not os.environ.get('DISPLAY') else None
+    try:
+        return compareRenderers(args)
+    finally:
+        if server is not None:
+            server.terminate()
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,59 @@
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+from badges import renderBadge
+from render import renderItemImage, DARKEN_FACTOR
+
+def renderItemBatch(atlas, filepath, scale, variants, resample=None):
+    # Renders every (badge, isDark) variant of one sprite at one scale.
+    # With NumPy the overlays and darkening are applied to the whole batch at
+    # once, using the same integer arithmetic as Image.paste and
+    # ImageEnhance.Brightness so the pixels match the one-at-a-time path.
+    from PIL import Image
+
+    if numpy is None or 'wallet' in filepath:
+        return [renderItemImage(atlas, filepath, scale, badge, isDark, resample)
+                for badge, isDark in variants]
+    if resample is None:
+        resample = Image.LANCZOS
+
+    base = atlas.resized(filepath, scale, resample)
+    overlays = {}
+    for badge, _ in variants:
+        if badge and badge not in overlays:
+            overlays[badge] = renderBadge(atlas, badge, scale, resample)
+    if base.mode != 'RGBA' or any(overlay.mode != 'RGBA' for overlay in overlays.values()):
+        return [renderItemImage(atlas, filepath, scale, badge, isDark, resample)
+                for badge, isDark in variants]
+
+    base_pixels = numpy.asarray(base)
+    batch = numpy.empty((len(variants),) + base_pixels.shape, dtype=numpy.uint8)
+    batch[:] = base_pixels
+
+    overlaid = [i for i, (badge, _) in enumerate(variants) if badge]
+    if overlaid:
+        overlay_pixels = numpy.stack([numpy.asarray(overlays[variants[i][0]]) for i in overlaid])
+        alpha = overlay_pixels[..., 3:4].astype(numpy.uint32)
+        blended = overlay_pixels * alpha + base_pixels.astype(numpy.uint32) * (255 - alpha) + 128
+        batch[overlaid] = ((blended >> 8) + blended) >> 8
+
+    dark = [i for i, (_, isDark) in enumerate(variants) if isDark]
+    if dark:
+        # Brightness blends the colour bands towards black and keeps alpha
+        colours = batch[dark, ..., :3].astype(numpy.float32) * numpy.float32(DARKEN_FACTOR)
+        batch[dark, ..., :3] = colours.astype(numpy.uint8)
+
+    return [Image.fromarray(pixels, 'RGBA') for pixels in batch]
+
+def groupRenderKeys(keys):
+    # Group (filepath, scale, badge, isDark) keys into batches that
+    # share a sprite and scale
+    groups = {}
+    for key in keys:
+        variants = groups.setdefault(key[:2], [])
+        if key[2:] not in variants:
+            variants.append(key[2:])
+
+    return groups
@@ -0,0 +1,56 @@
+from tkinter import Toplevel, Label, TclError
+
+DRAG_THRESHOLD = 6
+GHOST_ALPHA = 0.7
+GHOST_OFFSET = 8
+
+class DragController:
+    # Turns press/motion/release on a grid cell into either a click or a
+    # drag-and-drop. Only a small ghost window follows the pointer while
+    # dragging; the grid itself isn't touched until the drop.
+    def __init__(self, grid, click, drop):
+        self.grid = grid
+        self.click = click
+        self.drop = drop
+        self.source = None
+        self.start = None
+        self.ghost = None
+
+    def press(self, cell, event):
+        self.source = cell
+        self.start = (event.x_root, event.y_root)
+
+    def motion(self, event):
+        if self.source is None:
+            return
+        if self.ghost is None:
+            (start_x, start_y) = self.start
+            if abs(event.x_root - start_x) + abs(event.y_root - start_y) < DRAG_THRESHOLD:
+                return
+            self.createGhost()
+        self.ghost.geometry(f'+{event.x_root + GHOST_OFFSET}+{event.y_root + GHOST_OFFSET}')
+
+    def release(self, event):
+        (source, self.source) = (self.source, None)
+        if source is None:
+            return
+        if self.ghost is None:
+            self.click(*source)
+            return
+
+        self.ghost.destroy()
+        self.ghost = None
+        target = self.grid.cellAtPointer(event.x_root, event.y_root)
+        if target is not None and target != source:
+            self.drop(source, target)
+
+    def createGhost(self):
+        self.ghost = Toplevel(self.grid.master)
+        self.ghost.overrideredirect(True)
+        try:
+            self.ghost.attributes('-alpha', GHOST_ALPHA)
+        except TclError:
+            # Not every window manager supports transparency
+            pass
+        photo = self.grid.photoAt(*self.source)
+        Label(self.ghost, image=photo, bd=0, bg=self.grid.config['Background']).pack()
@@ -0,0 +1,434 @@
+from tkinter import Button, Canvas, Frame, Scrollbar
+from tkinter import font
+
+from dragdrop import DragController
+
+TRACKER_FONT = ('Liberation Mono', 8)
+CELL_PADDING = 2
+VIEWPORT_ROWS = 9
+VIEWPORT_COLUMNS = 6
+SCROLL_STEPS_PER_CELL = 4
+
+class ButtonGrid:
+    def __init__(self, master, config, row_offset, forward, backward, drop):
+        self.master = master
+        self.config = config
+        self.row_offset = row_offset
+        self.forward = forward
+        self.backward = backward
+        self.drag = DragController(self, forward, drop)
+        self.cells = []
+        self.hovered = None
+
+    def shape(self):
+        return tuple(len(cell_row) for cell_row in self.cells)
+
+    def layout(self, shape, scale):
+        # Buttons are sized by the grid geometry manager, so scale is unused
+        if self.shape() == shape:
+            return
+
+        self.destroy()
+        for y in range(len(shape)):
+            cell_row = []
+            for x in range(shape[y]):
+                cell_row.append(self.createCell(x, y))
+            self.cells.append(cell_row)
+
+    def createCell(self, x, y):
+        button = Button(self.master, compound='top')
+        # Left click fires on release, so a press can turn into a drag instead
+        button.bind('<ButtonPress-1>', lambda event, x=x, y=y: self.drag.press((x, y), event))
+        button.bind('<B1-Motion>', self.drag.motion)
+        button.bind('<ButtonRelease-1>', self.drag.release)
+        button.bind('<Button-3>', lambda event, x=x, y=y: self.backward(x, y)) # Right click
+        button.bind('<Enter>', lambda event, x=x, y=y: self.setHovered((x, y)))
+        button.bind('<Leave>', lambda event: self.setHovered(None))
+        button.grid(row=y + self.row_offset, column=x, sticky='NSEW')
+        button.configure(highlightthickness=0, bd=0, font=TRACKER_FONT)
+        self.colorCell(button)
+
+        return button
+
+    def colorCell(self, button):
+        button.configure(fg=self.config["ForegroundAlt"], activeforeground=self.config["ForegroundAlt"],
+                         bg=self.config["Background"], activebackground=self.config["Focus"])
+
+    def recolor(self):
+        for cell_row in self.cells:
+            for button in cell_row:
+                self.colorCell(button)
+
+    def visibleCells(self):
+        return [(x, y) for y in range(len(self.cells)) for x in range(len(self.cells[y]))]
+
+    def isVisible(self, x, y):
+        return True
+
+    def columnCount(self):
+        return max(self.shape(), default=0)
+
+    def setHovered(self, cell):
+        self.hovered = cell
+
+    def photoAt(self, x, y):
+        return self.cells[y][x].image
+
+    def cellAtPointer(self, x_root, y_root):
+        widget = self.master.winfo_containing(x_root, y_root)
+        if widget is None:
+            return None
+        info = widget.grid_info()
+        if not info:
+            return None
+        (column, row) = (info['column'], info['row'] - self.row_offset)
+        # Only our own buttons count, not the title bar, the command rows or
+        # widgets in other windows that happen to share grid coordinates
+        if row < 0 or row >= len(self.cells) or column < 0 or column >= len(self.cells[row]) or \
+           self.cells[row][column] is not widget:
+            return None
+
+        return (column, row)
+
+    def render(self, x, y, photo, itemText):
+        button = self.cells[y][x]
+        button.configure(image=photo, text=itemText)
+        # Keep a reference so the image isn't garbage collected
+        button.image = photo
+
+    def destroy(self):
+        for cell_row in self.cells:
+            for button in cell_row:
+                button.destroy()
+        self.cells = []
+        self.hovered = None
+
+class CanvasGrid:
+    def __init__(self, master, config, row_offset, forward, backward, drop, columnspan):
+        self.master = master
+        self.config = config
+        self.row_offset = row_offset
+        self.forward = forward
+        self.backward = backward
+        self.drag = DragController(self, forward, drop)
+        self.columnspan = columnspan
+        self.hovered = None
+        self.cells = []
+        self.photos = []
+        self.canvas = None
+        self.scale = None
+        self.text_height = font.Font(font=TRACKER_FONT).metrics('linespace')
+
+    def shape(self):
+        return tuple(len(cell_row) for cell_row in self.cells)
+
+    def layout(self, shape, scale):
+        if self.shape() == shape:
+            if self.scale != scale:
+                self.resize(scale)
+            return
+
+        self.destroy()
+        self.setCellSize(scale)
+        self.canvas = Canvas(self.master, bg=self.config["Background"], highlightthickness=0, bd=0)
+        self.resizeCanvas(shape)
+        self.canvas.grid(row=self.row_offset, column=0, rowspan=max(len(shape), 1),
+                         columnspan=self.columnspan)
+        self.bindCanvas()
+
+        for y in range(len(shape)):
+            cell_row = []
+            for x in range(shape[y]):
+                cell_row.append(self.createCell(x, y))
+            self.cells.append(cell_row)
+            self.photos.append([None] * shape[y])
+
+    def bindCanvas(self):
+        # Left click fires on release, so a press can turn into a drag instead
+        self.canvas.bind('<ButtonPress-1>', self.onPress)
+        self.canvas.bind('<B1-Motion>', self.drag.motion)
+        self.canvas.bind('<ButtonRelease-1>', self.drag.release)
+        self.canvas.bind('<Button-3>', lambda event: self.onClick(event, self.backward)) # Right click
+        self.canvas.bind('<Motion>', lambda event: self.setHovered(self.cellAt(event.x, event.y)))
+        self.canvas.bind('<Leave>', lambda event: self.setHovered(None))
+
+    def setCellSize(self, scale):
+        self.scale = scale
+        self.cell_width = scale + 2 * CELL_PADDING
+        self.cell_height = scale + self.text_height + 2 * CELL_PADDING
+
+    def resizeCanvas(self, shape):
+        self.canvas.configure(width=max(shape, default=0) * self.cell_width,
+                              height=len(shape) * self.cell_height)
+
+    def resize(self, scale):
+        # Move the existing canvas items instead of recreating them
+        self.setCellSize(scale)
+        self.resizeCanvas(self.shape())
+        for y in range(len(self.cells)):
+            for x in range(len(self.cells[y])):
+                self.placeCell(self.cells[y][x], x, y)
+
+    def cellOrigin(self, x, y):
+        return (x * self.cell_width + self.cell_width // 2, y * self.cell_height + CELL_PADDING)
+
+    def placeCell(self, cell_ids, x, y):
+        (image_id, text_id) = cell_ids
+        (center, top) = self.cellOrigin(x, y)
+        self.canvas.coords(image_id, center, top)
+        self.canvas.coords(text_id, center, top + self.scale)
+
+    def createCell(self, x, y):
+        (center, top) = self.cellOrigin(x, y)
+        image_id = self.canvas.create_image(center, top, anchor='n')
+        text_id = self.canvas.create_text(center, top + self.scale, anchor='n',
+                                          fill=self.config["ForegroundAlt"], font=TRACKER_FONT)
+
+        return (image_id, text_id)
+
+    def recolor(self):
+        if self.canvas is None:
+            return
+        self.canvas.configure(bg=self.config["Background"])
+        for cell_row in self.cells:
+            for (_, text_id) in cell_row:
+                self.canvas.itemconfigure(text_id, fill=self.config["ForegroundAlt"])
+
+    def cellAt(self, x, y):
+        column = x // self.cell_width
+        row = y // self.cell_height
+        if row < 0 or row >= len(self.cells) or column < 0 or column >= len(self.cells[row]):
+            return None
+
+        return (column, row)
+
+    def visibleCells(self):
+        return [(x, y) for y in range(len(self.cells)) for x in range(len(self.cells[y]))]
+
+    def isVisible(self, x, y):
+        return True
+
+    def columnCount(self):
+        return self.columnspan
+
+    def cellAtPointer(self, x_root, y_root):
+        if self.canvas is None:
+            return None
+
+        return self.cellAt(x_root - self.canvas.winfo_rootx(), y_root - self.canvas.winfo_rooty())
+
+    def setHovered(self, cell):
+        self.hovered = cell
+
+    def photoAt(self, x, y):
+        return self.photos[y][x]
+
+    def onPress(self, event):
+        cell = self.cellAt(event.x, event.y)
+        if cell is not None:
+            self.drag.press(cell, event)
+
+    def onClick(self, event, handler):
+        cell = self.cellAt(event.x, event.y)
+        if cell is not None:
+            handler(*cell)
+
+    def render(self, x, y, photo, itemText):
+        (image_id, text_id) = self.cells[y][x]
+        self.canvas.itemconfigure(image_id, image=photo)
+        self.canvas.itemconfigure(text_id, text=itemText)
+        # Keep a reference so the image isn't garbage collected
+        self.photos[y][x] = photo
+
+    def destroy(self):
+        if self.canvas is not None:
+            self.canvas.destroy()
+            self.canvas = None
+        self.cells = []
+        self.photos = []
+        self.hovered = None
+
+class VirtualGrid(CanvasGrid):
+    # A scrollable canvas that only has canvas items for the cells in view.
+    # Scrolling moves a small pool of items onto the newly exposed cells and
+    # asks the tracker to paint just those, so memory and paint time follow
+    # the size of the viewport instead of the size of the layout.
+    def __init__(self, master, config, row_offset, forward, backward, drop, columnspan, expose):
+        super().__init__(master, config, row_offset, forward, backward, drop, columnspan)
+        self.expose = expose
+        self.cell_shape = ()
+        self.slots = {}
+        self.photos = {}
+        self.free = []
+        self.frame = None
+
+    def shape(self):
+        return self.cell_shape
+
+    def layout(self, shape, scale):
+        if self.canvas is not None and self.cell_shape == shape:
+            if self.scale != scale:
+                self.resize(scale)
+            return
+
+        self.destroy()
+        self.cell_shape = shape
+        self.setCellSize(scale)
+        self.frame = Frame(self.master, bg=self.config["Background"])
+        self.canvas = Canvas(self.frame, bg=self.config["Background"], highlightthickness=0, bd=0)
+        vertical = Scrollbar(self.frame, orient='vertical', command=self.yview)
+        horizontal = Scrollbar(self.frame, orient='horizontal', command=self.xview)
+        self.canvas.configure(xscrollcommand=horizontal.set, yscrollcommand=vertical.set)
+        self.canvas.grid(row=0, column=0, sticky='NSEW')
+        vertical.grid(row=0, column=1, sticky='NS')
+        horizontal.grid(row=1, column=0, sticky='EW')
+        self.frame.grid_rowconfigure(0, weight=1)
+        self.frame.grid_columnconfigure(0, weight=1)
+        self.frame.grid(row=self.row_offset, column=0, rowspan=max(len(shape), 1),
+                        columnspan=self.columnspan, sticky='NSEW')
+        self.resizeCanvas(shape)
+        self.bindCanvas()
+        self.canvas.bind('<Configure>', lambda event: self.updateViewport())
+        # Windows and macOS send MouseWheel, X11 sends buttons 4 and 5
+        self.canvas.bind('<MouseWheel>', lambda event: self.scroll(event, 'y', -event.delta))
+        self.canvas.bind('<Shift-MouseWheel>', lambda event: self.scroll(event, 'x', -event.delta))
+        self.canvas.bind('<Button-4>', lambda event: self.scroll(event, 'y', -1))
+        self.canvas.bind('<Button-5>', lambda event: self.scroll(event, 'y', 1))
+        self.canvas.bind('<Shift-Button-4>', lambda event: self.scroll(event, 'x', -1))
+        self.canvas.bind('<Shift-Button-5>', lambda event: self.scroll(event, 'x', 1))
+
+        # The tracker paints the first viewport itself after layout
+        self.updateViewport(expose=False)
+
+    def resizeCanvas(self, shape):
+        columns = max(shape, default=0)
+        rows = len(shape)
+        self.canvas.configure(width=min(columns, VIEWPORT_COLUMNS) * self.cell_width,
+                              height=min(rows, VIEWPORT_ROWS) * self.cell_height,
+                              scrollregion=(0, 0, columns * self.cell_width, rows * self.cell_height),
+                              xscrollincrement=max(1, self.cell_width // SCROLL_STEPS_PER_CELL),
+                              yscrollincrement=max(1, self.cell_height // SCROLL_STEPS_PER_CELL))
+
+    def resize(self, scale):
+        self.setCellSize(scale)
+        self.resizeCanvas(self.cell_shape)
+        for cell, slot in self.slots.items():
+            self.placeCell(slot, *cell)
+        self.updateViewport(expose=False)
+
+    def getViewportSize(self):
+        # Before the canvas is mapped its real size is 1x1, so fall back to
+        # the requested size
+        width = self.canvas.winfo_width()
+        height = self.canvas.winfo_height()
+        if width <= 1 or height <= 1:
+            width = int(self.canvas.cget('width'))
+            height = int(self.canvas.cget('height'))
+
+        return (width, height)
+
+    def getViewportCells(self):
+        (width, height) = self.getViewportSize()
+        left = int(self.canvas.canvasx(0))
+        top = int(self.canvas.canvasy(0))
+        first_row = max(0, top // self.cell_height)
+        last_row = min(len(self.cell_shape) - 1, (top + height - 1) // self.cell_height)
+        first_column = max(0, left // self.cell_width)
+        last_column = (left + width - 1) // self.cell_width
+
+        return [(x, y) for y in range(first_row, last_row + 1)
+                for x in range(first_column, min(last_column + 1, self.cell_shape[y]))]
+
+    def updateViewport(self, expose=True):
+        if self.canvas is None:
+            return
+
+        cells = self.getViewportCells()
+        visible = set(cells)
+        for cell in [cell for cell in self.slots if cell not in visible]:
+            slot = self.slots.pop(cell)
+            self.photos.pop(cell, None)
+            for item_id in slot:
+                self.canvas.itemconfigure(item_id, state='hidden')
+            self.free.append(slot)
+
+        exposed = [cell for cell in cells if cell not in self.slots]
+        for cell in exposed:
+            if self.free:
+                slot = self.free.pop()
+                for item_id in slot:
+                    self.canvas.itemconfigure(item_id, state='normal')
+                self.canvas.itemconfigure(slot[0], image='')
+                self.canvas.itemconfigure(slot[1], text='')
+                self.placeCell(slot, *cell)
+            else:
+                slot = self.createCell(*cell)
+            self.slots[cell] = slot
+
+        if exposed and expose:
+            self.expose(exposed)
+
+    def xview(self, *args):
+        self.canvas.xview(*args)
+        self.updateViewport()
+
+    def yview(self, *args):
+        self.canvas.yview(*args)
+        self.updateViewport()
+
+    def scroll(self, event, axis, delta):
+        steps = delta // 120 if abs(delta) >= 120 else (1 if delta > 0 else -1)
+        if axis == 'y':
+            self.canvas.yview_scroll(steps * SCROLL_STEPS_PER_CELL // 2, 'units')
+        else:
+            self.canvas.xview_scroll(steps * SCROLL_STEPS_PER_CELL // 2, 'units')
+        self.updateViewport()
+        self.setHovered(self.cellAt(event.x, event.y))
+
+    def recolor(self):
+        if self.canvas is None:
+            return
+        self.frame.configure(bg=self.config["Background"])
+        self.canvas.configure(bg=self.config["Background"])
+        for (_, text_id) in list(self.slots.values()) + self.free:
+            self.canvas.itemconfigure(text_id, fill=self.config["ForegroundAlt"])
+
+    def cellAt(self, x, y):
+        # x and y are relative to the canvas window, not the scrolled content
+        column = int(self.canvas.canvasx(x)) // self.cell_width
+        row = int(self.canvas.canvasy(y)) // self.cell_height
+        if row < 0 or row >= len(self.cell_shape) or column < 0 or column >= self.cell_shape[row]:
+            return None
+
+        return (column, row)
+
+    def visibleCells(self):
+        return sorted(self.slots, key=lambda cell: (cell[1], cell[0]))
+
+    def isVisible(self, x, y):
+        return (x, y) in self.slots
+
+    def photoAt(self, x, y):
+        return self.photos.get((x, y))
+
+    def render(self, x, y, photo, itemText):
+        slot = self.slots.get((x, y))
+        if slot is None:
+            # Scrolled out of view, it is painted again when it comes back
+            return
+        (image_id, text_id) = slot
+        self.canvas.itemconfigure(image_id, image=photo)
+        self.canvas.itemconfigure(text_id, text=itemText)
+        # Keep a reference so the image isn't garbage collected
+        self.photos[(x, y)] = photo
+
+    def destroy(self):
+        if self.frame is not None:
+            self.frame.destroy()
+            self.frame = None
+            self.canvas = None
+        self.cell_shape = ()
+        self.slots = {}
+        self.photos = {}
+        self.free = []
+        self.hovered = None
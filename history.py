@@ -0,0 +1,35 @@
+from collections import deque
+
+HISTORY_LENGTH = 500
+
+class History:
+    # Changes are small tuples: ('value', x, y, before, after) for a state
+    # change, ('move', x1, y1, x2, y2) for a swap, and ('snapshot', before,
+    # after) holding State snapshots for bulk changes like clearing or loading
+    def __init__(self, max_length=HISTORY_LENGTH):
+        self.undo_stack = deque(maxlen=max_length)
+        self.redo_stack = deque(maxlen=max_length)
+
+    def record(self, change):
+        self.undo_stack.append(change)
+        self.redo_stack.clear()
+
+    def undo(self):
+        if not self.undo_stack:
+            return None
+        change = self.undo_stack.pop()
+        self.redo_stack.append(change)
+
+        return change
+
+    def redo(self):
+        if not self.redo_stack:
+            return None
+        change = self.redo_stack.pop()
+        self.undo_stack.append(change)
+
+        return change
+
+    def clear(self):
+        self.undo_stack.clear()
+        self.redo_stack.clear()
@@ -0,0 +1,26 @@
+from collections import OrderedDict
+
+class ImageCache:
+    def __init__(self, max_size):
+        self.max_size = max_size
+        self.images = OrderedDict()
+
+    def get(self, key):
+        image = self.images.get(key)
+        if image is not None:
+            self.images.move_to_end(key)
+
+        return image
+
+    def put(self, key, image):
+        self.images[key] = image
+        self.images.move_to_end(key)
+        while len(self.images) > self.max_size:
+            # Evict the least recently used image
+            self.images.popitem(last=False)
+
+    def clear(self):
+        self.images.clear()
+
+    def __len__(self):
+        return len(self.images)
@@ -0,0 +1,100 @@
+import json
+import threading
+import time
+
+# Upper bounds of the histogram buckets, in microseconds
+BUCKET_BOUNDS = [50, 100, 250, 500, 1000, 2500, 5000, 10000, 25000, 50000, 100000, 250000, float('inf')]
+
+class LatencyHistogram:
+    def __init__(self):
+        self.counts = [0] * len(BUCKET_BOUNDS)
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def add(self, seconds):
+        micros = seconds * 1e6
+        for i, bound in enumerate(BUCKET_BOUNDS):
+            if micros <= bound:
+                self.counts[i] += 1
+                break
+        self.count += 1
+        self.total += micros
+        self.max = max(self.max, micros)
+
+    def percentile(self, fraction):
+        # Upper bound of the bucket holding the percentile, capped at the max
+        target = fraction * self.count
+        seen = 0
+        for i, count in enumerate(self.counts):
+            seen += count
+            if seen >= target and count:
+                return min(BUCKET_BOUNDS[i], self.max)
+
+        return self.max
+
+    def summary(self):
+        return {
+                'count': self.count,
+                'mean': self.total / self.count if self.count else 0.0,
+                'p50': self.percentile(0.50),
+                'p90': self.percentile(0.90),
+                'p99': self.percentile(0.99),
+                'max': self.max
+               }
+
+HISTOGRAMS = {}
+
+def record(name, seconds):
+    # Only the Tk thread is measured. Renders on the pre-render pool would mix
+    # background work into the click numbers, and the histograms aren't locked.
+    if threading.current_thread() is not threading.main_thread():
+        return
+    histogram = HISTOGRAMS.get(name)
+    if histogram is None:
+        histogram = HISTOGRAMS.setdefault(name, LatencyHistogram())
+    histogram.add(seconds)
+
+class timed:
+    def __init__(self, name):
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+
+    def __exit__(self, *exc_info):
+        record(self.name, time.perf_counter() - self.start)
+
+def formatReport():
+    lines = [f'{"stage":<22}{"count":>7}{"p50":>9}{"p99":>9}{"max":>9}  (us)']
+    for name in sorted(HISTOGRAMS):
+        summary = HISTOGRAMS[name].summary()
+        lines.append(f'{name:<22}{summary["count"]:>7}{summary["p50"]:>9.0f}'
+                     + f'{summary["p99"]:>9.0f}{summary["max"]:>9.0f}')
+
+    return '\n'.join(lines)
+
+def dumpReport(path):
+    # One JSON line per dump, so a log can be appended to for a whole session
+    snapshot = { name: histogram.summary() for name, histogram in HISTOGRAMS.items() }
+    with open(path, 'a') as outfile:
+        outfile.write(json.dumps({ 'time': time.time(), 'stages': snapshot }) + '\n')
+
+class StartupTimer:
+    def __init__(self, started, enabled=True):
+        self.started = started
+        self.last = started
+        self.enabled = enabled
+        self.marks = []
+
+    def mark(self, name):
+        now = time.perf_counter()
+        self.marks.append((name, now - self.last, now - self.started))
+        self.last = now
+
+    def report(self):
+        if not self.enabled:
+            return
+        print(f'{"startup step":<22}{"step":>9}{"total":>9}  (ms)')
+        for name, step, total in self.marks:
+            print(f'{name:<22}{step * 1000:>9.1f}{total * 1000:>9.1f}')
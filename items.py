@@ -1,11 +1,91 @@
-import json
+import sys
+from array import array
+
+from stateformat import loadStateFile, StateFormatError
 
 ITEM_DIR = 'img/items/'
+VALUE_TYPE = 'H'
+MAX_VALUE = 0xFFFF
+
+# Every distinct list of progressive states is stored once and shared by all
+# items that use it
+STATE_TABLES = {}
+
+def internStates(states):
+    table = tuple(sys.intern(state) for state in states)
+
+    return STATE_TABLES.setdefault(table, table)
+
+def checkRange(value, maximum, field):
+    if type(value) is not int or not 0 <= value <= maximum:
+        raise ValueError(f'{field} must be a whole number from 0 to {maximum}, not {value!r}')
+
+    return value
+
+SLOT_NAMES = {}
+
+def getSlotNames(item_type):
+    slots = SLOT_NAMES.get(item_type)
+    if slots is None:
+        slots = tuple(slot for cls in item_type.__mro__ for slot in getattr(cls, '__slots__', ()))
+        SLOT_NAMES[item_type] = slots
+
+    return slots
 
 class Item:
+    # The current value of an item lives at values[index], so a whole layout
+    # can share one flat array that is cheap to copy and reset
+    __slots__ = ('name', 'itemText', 'values', 'index')
+
     def __init__(self, name, itemText=''):
-        self.name = name
-        self.itemText = itemText
+        self.name = sys.intern(name)
+        self.itemText = sys.intern(itemText)
+        self.values = array(VALUE_TYPE, [0])
+        self.index = 0
+
+    def __copy__(self):
+        item_type = type(self)
+        item = object.__new__(item_type)
+        for slot in getSlotNames(item_type):
+            setattr(item, slot, getattr(self, slot))
+
+        return item
+
+    def bind(self, values, index):
+        # Shallow copy of this item whose value is stored at values[index]
+        item = self.__copy__()
+        item.values = values
+        item.index = index
+
+        return item
+
+    def detach(self):
+        # Copy with its own storage, so stepping it leaves this item alone
+        return self.bind(array(VALUE_TYPE, [self.value]), 0)
+
+    def attach(self, values, value):
+        # Store the value of a new item at the end of a shared value array
+        self.values = values
+        self.index = len(values)
+        values.append(value)
+
+        return self
+
+    @classmethod
+    def from_json_state(cls, item_state, values):
+        item = object.__new__(cls)
+        item.name = sys.intern(item_state['name'])
+        item.itemText = sys.intern(item_state.get('itemText', ''))
+
+        return item.attach(values, 0)
+
+    @property
+    def value(self):
+        return self.values[self.index]
+
+    @value.setter
+    def value(self, value):
+        self.values[self.index] = value
 
     def next_state(self):
         # Base Item has no alternate states
@@ -25,11 +105,31 @@ class Item:
         # Base Item can never be dark
         return False
 
+    def state_count(self):
+        return 1
+
 class ProgressiveItem(Item):
+    __slots__ = ('states',)
+
     def __init__(self, states, current_state=0, itemText=''):
-        self.states = states
+        self.states = internStates(states)
+        super().__init__(self.states[current_state], itemText)
         self.current_state = current_state
-        super().__init__(states[self.current_state], itemText)
+
+    current_state = Item.value
+
+    @classmethod
+    def from_json_state(cls, item_state, values):
+        states = item_state['states']
+        if not isinstance(states, list) or not states:
+            raise ValueError('states must be a non-empty list')
+        current_state = checkRange(item_state.get('current_state', 0), len(states) - 1, 'current_state')
+        item = object.__new__(cls)
+        item.states = internStates(states)
+        item.name = item.states[current_state]
+        item.itemText = sys.intern(item_state.get('itemText', ''))
+
+        return item.attach(values, current_state)
 
     def next_state(self):
         self.current_state = (self.current_state + 1) % len(self.states)
@@ -46,7 +146,7 @@ class ProgressiveItem(Item):
     def get_json_state(self):
         return {
                 'type': 'ProgressiveItem',
-                'states': self.states,
+                'states': list(self.states),
                 'current_state': self.current_state,
                 'itemText': self.itemText
                }
@@ -54,10 +154,26 @@ class ProgressiveItem(Item):
     def isDark(self):
         return self.current_state == 0
 
+    def state_count(self):
+        return len(self.states)
+
 class ToggleItem(ProgressiveItem):
+    __slots__ = ()
+
     def __init__(self, name, current_state=0, itemText=''):
         super().__init__([name,name], current_state, itemText)
-        self.name = name
+        self.name = sys.intern(name)
+
+    @classmethod
+    def from_json_state(cls, item_state, values):
+        name = item_state['name']
+        current_state = checkRange(item_state.get('current_state', 0), 1, 'current_state')
+        item = object.__new__(cls)
+        item.states = internStates([name, name])
+        item.name = sys.intern(name)
+        item.itemText = sys.intern(item_state.get('itemText', ''))
+
+        return item.attach(values, current_state)
 
     def get_json_state(self):
         return {
@@ -68,11 +184,26 @@ class ToggleItem(ProgressiveItem):
                }
 
 class NumberedItem(Item):
+    __slots__ = ('max_num',)
+
     def __init__(self, name, max_num, current_num=0, itemText=''):
         super().__init__(name, itemText)
         self.max_num = max_num
         self.current_num = current_num
 
+    current_num = Item.value
+
+    @classmethod
+    def from_json_state(cls, item_state, values):
+        max_num = checkRange(item_state['max_num'], MAX_VALUE, 'max_num')
+        current_num = checkRange(item_state.get('current_num', 0), max_num, 'current_num')
+        item = object.__new__(cls)
+        item.name = sys.intern(item_state['name'])
+        item.max_num = max_num
+        item.itemText = sys.intern(item_state.get('itemText', ''))
+
+        return item.attach(values, current_num)
+
     def next_state(self):
         self.current_num = (self.current_num + 1) % (self.max_num + 1)
 
@@ -100,12 +231,120 @@ class NumberedItem(Item):
     def isDark(self):
         return self.current_num == 0
 
+    def state_count(self):
+        return self.max_num + 1
+
+# Item types by the name used in template and state files. Each one builds
+# its items with from_json_state, and registerItemType adds new ones.
+ITEM_TYPES = { item_type.__name__: item_type for item_type in (Item, ProgressiveItem, ToggleItem, NumberedItem) }
+
+def registerItemType(name, item_type):
+    if name in ITEM_TYPES:
+        raise ValueError(f'Item type {name} is already registered')
+    ITEM_TYPES[name] = item_type
+
+def resolveItemTypes(types=None):
+    # Maps every type name to its item class and the fields it fills in. A
+    # file can declare its own types in a 'types' table, each naming the type
+    # it is based on and giving default values for any of its fields:
+    #
+    #   "types": { "Dungeon": { "type": "ProgressiveItem",
+    #                           "states": ["questionmark", "fusedshadow", "mirrorshard"] } }
+    resolved = { name: (item_type, None) for name, item_type in ITEM_TYPES.items() }
+    types = types or {}
+    if not isinstance(types, dict):
+        raise StateFormatError('types must map type names to their definitions')
+
+    def resolve(name, seen):
+        if name in resolved:
+            return resolved[name]
+        declared = types.get(name)
+        if declared is None:
+            raise StateFormatError(f'Item type {name} does not exist')
+        if not isinstance(declared, dict) or 'type' not in declared:
+            raise StateFormatError(f'Item type {name} must name the type it is based on')
+        if name in seen:
+            raise StateFormatError(f'Item type {name} is based on itself')
+        (item_type, fields) = resolve(declared['type'], seen | {name})
+        fields = { **(fields or {}), **declared }
+        del fields['type']
+        resolved[name] = (item_type, fields)
+
+        return resolved[name]
+
+    for name in types:
+        if name in ITEM_TYPES:
+            raise StateFormatError(f'Item type {name} is already defined')
+        resolve(name, frozenset())
+
+    return resolved
+
+def buildItems(json_state, types=None):
+    # Build a layout straight onto one shared value array in a single pass.
+    # Returns (items, values) like packItems.
+    resolved = resolveItemTypes(types)
+    values = array(VALUE_TYPE)
+    items = []
+    (x, y) = (0, 0)
+    try:
+        for y, row in enumerate(json_state):
+            item_row = []
+            for x, item_state in enumerate(row):
+                entry = resolved.get(item_state['type'])
+                if entry is None:
+                    raise StateFormatError(f'Item type {item_state["type"]} does not exist '
+                                           f'(row {y + 1}, column {x + 1})')
+                (item_type, fields) = entry
+                if fields:
+                    item_state = { **fields, **item_state }
+                item_row.append(item_type.from_json_state(item_state, values))
+            items.append(item_row)
+    except StateFormatError:
+        raise
+    except KeyError as error:
+        raise StateFormatError(f'Item at row {y + 1}, column {x + 1} is missing {error}')
+    except (TypeError, ValueError, IndexError, OverflowError) as error:
+        raise StateFormatError(f'Invalid item at row {y + 1}, column {x + 1}: {error}')
+
+    return (items, values)
+
+def packItems(items):
+    # Rebind a layout of items onto one shared value array
+    values = getPackedValues(items)
+    if values is not None:
+        # Already built that way by buildItems
+        return (items, values)
+    values = array(VALUE_TYPE)
+    packed = []
+    for row in items:
+        packed_row = []
+        for item in row:
+            packed_row.append(item.bind(values, len(values)))
+            values.append(item.value)
+        packed.append(packed_row)
+
+    return (packed, values)
+
+def getPackedValues(items):
+    # The array every item is bound to in order, or None if they aren't
+    cells = [item for row in items for item in row]
+    if not cells:
+        return None
+    values = cells[0].values
+    if len(values) != len(cells) or \
+       not all(item.values is values and item.index == index for index, item in enumerate(cells)):
+        return None
+
+    return values
+
+def rebindItems(items, values):
+    return [[item.bind(values, item.index) for item in row] for row in items]
+
 def getDefaultItems():
     try:
-        with open('template.json') as infile:
-            tracker_state = json.load(infile)
-            state_items = tracker_state['items']
-            default_items = convertJSONtoItems(state_items)
+        tracker_state = loadStateFile('template.json')
+        state_items = tracker_state['items']
+        default_items = convertJSONtoItems(state_items, tracker_state.get('types'))
 
         return default_items
     except FileNotFoundError:
@@ -172,37 +411,6 @@ def getHardcodedDefaults():
 
     return default_items
 
-def convertJSONtoItems(json_state):
-    items = []
-    for row in json_state:
-        item_row = []
-        for item_state in row:
-            item_type = item_state['type']
-            if item_type == 'Item':
-                item = Item(item_state['name'], item_state['itemText'])
-            elif item_type == 'ProgressiveItem':
-                item = ProgressiveItem(
-                        item_state['states'],
-                        item_state['current_state'],
-                        item_state['itemText']
-                )
-            elif item_type == 'ToggleItem':
-                item = ToggleItem(
-                        item_state['name'],
-                        item_state['current_state'],
-                        item_state['itemText']
-                )
-            elif item_type == 'NumberedItem':
-                item = NumberedItem(
-                        item_state['name'],
-                        item_state['max_num'],
-                        item_state['current_num'],
-                        item_state['itemText']
-                )
-            else:
-                print(f"Error: Item type {item_type} does not exist!")
-                exit(1)
-            item_row.append(item)
-        items.append(item_row)
-
-    return items
+def convertJSONtoItems(json_state, types=None):
+    # Raises StateFormatError for unknown item types and invalid items
+    return buildItems(json_state, types)[0]
@@ -0,0 +1,169 @@
+import json
+import os
+import threading
+
+from writer import BackgroundWriter
+
+JOURNAL_FILE = 'autosave.journal'
+SNAPSHOT_FILE = 'autosave.json'
+COMPACT_INTERVAL = 500
+
+class Journal:
+    def __init__(self, state, writer=None, journal_path=JOURNAL_FILE, snapshot_path=SNAPSHOT_FILE,
+                 compact_interval=COMPACT_INTERVAL):
+        self.state = state
+        self.writer = writer or BackgroundWriter()
+        self.journal_path = journal_path
+        self.snapshot_path = snapshot_path
+        self.compact_interval = compact_interval
+        self.outfile = None
+        self.active = False
+        self.generation = 0
+        self.records = 0
+        # Records made since the last snapshot was taken, carried over into
+        # the new journal once that snapshot is on disk
+        self.carried = []
+        self.lock = threading.Lock()
+
+    def start(self):
+        self.generation = readSnapshotGeneration(self.snapshot_path)
+        self.active = True
+        self.compact()
+
+    def recordNext(self, x, y):
+        self.append(f'n {x} {y}\n')
+
+    def recordPrev(self, x, y):
+        self.append(f'p {x} {y}\n')
+
+    def recordSet(self, x, y, value):
+        self.append(f's {x} {y} {value}\n')
+
+    def recordMove(self, x1, y1, x2, y2):
+        self.append(f'm {x1} {y1} {x2} {y2}\n')
+
+    def append(self, record):
+        if not self.active:
+            return
+
+        with self.lock:
+            # Line buffered, so every record reaches the OS as soon as it's written
+            if self.outfile is not None:
+                self.outfile.write(record)
+            self.carried.append(record)
+        self.records += 1
+        if self.records >= self.compact_interval:
+            self.compact()
+
+    def compact(self):
+        if not self.active:
+            return
+
+        # The state is taken here and written on the background writer. Until
+        # the snapshot is on disk the old journal stays current, with a marker
+        # where the new snapshot begins, so a crash at any point can still be
+        # replayed. Once it lands the journal is rolled over to the new
+        # generation.
+        self.generation += 1
+        generation = self.generation
+        tracker_state = self.state.serializeState()
+        tracker_state['generation'] = generation
+        with self.lock:
+            if self.outfile is not None:
+                self.outfile.write(f'c {generation}\n')
+            self.carried = []
+        self.records = 0
+        self.writer.submit(self.snapshot_path, lambda: json.dumps(tracker_state).encode('utf-8'),
+                           lambda: self.rollOver(generation))
+
+    def rollOver(self, generation):
+        # Called on the writer thread once the snapshot for generation is saved
+        with self.lock:
+            if not self.active or generation != self.generation:
+                # Closed, or a newer snapshot is already on its way
+                return
+            if self.outfile is not None:
+                self.outfile.close()
+            self.outfile = open(self.journal_path, 'w', buffering=1)
+            self.outfile.write(f'g {generation}\n')
+            self.outfile.writelines(self.carried)
+            self.carried = []
+
+    def close(self, discard=True):
+        if not self.active:
+            return
+        self.writer.flush()
+        with self.lock:
+            self.active = False
+            if self.outfile is not None:
+                self.outfile.close()
+                self.outfile = None
+        if discard:
+            # A clean exit leaves nothing to recover
+            for path in (self.journal_path, self.snapshot_path):
+                if os.path.exists(path):
+                    os.remove(path)
+
+def readSnapshotGeneration(snapshot_path=SNAPSHOT_FILE):
+    try:
+        with open(snapshot_path) as infile:
+            return json.load(infile).get('generation', 0)
+    except (OSError, ValueError):
+        return 0
+
+def hasRecoverableSession(snapshot_path=SNAPSHOT_FILE):
+    return os.path.exists(snapshot_path)
+
+def applyRecord(items, fields):
+    op = fields[0]
+    coords = [int(field) for field in fields[1:]]
+    if op == 'n':
+        (x, y) = coords
+        items[y][x].next_state()
+    elif op == 'p':
+        (x, y) = coords
+        items[y][x].prev_state()
+    elif op == 's':
+        (x, y, value) = coords
+        items[y][x].value = value
+    elif op == 'm':
+        (x1, y1, x2, y2) = coords
+        (items[y1][x1], items[y2][x2]) = (items[y2][x2], items[y1][x1])
+
+def recoverSession(state, journal_path=JOURNAL_FILE, snapshot_path=SNAPSHOT_FILE):
+    try:
+        with open(snapshot_path) as infile:
+            snapshot = json.load(infile)
+    except (OSError, ValueError):
+        return False
+    try:
+        state.updateItems(snapshot['items'])
+    except (KeyError, ValueError):
+        # A snapshot this damaged can't be recovered
+        return False
+
+    try:
+        with open(journal_path) as infile:
+            lines = infile.readlines()
+    except OSError:
+        return True
+    generation = snapshot.get('generation', 0)
+    if lines and lines[0].split() == ['g', str(generation)]:
+        records = lines[1:]
+    elif f'c {generation}\n' in lines:
+        # The snapshot was saved but the journal wasn't rolled over yet, replay
+        # what came after its marker
+        records = lines[lines.index(f'c {generation}\n') + 1:]
+    else:
+        # Journal predates the snapshot, everything is already in it
+        return True
+
+    for line in records:
+        fields = line.split()
+        try:
+            applyRecord(state.items, fields)
+        except (ValueError, IndexError):
+            # A torn final record from the crash, stop replaying here
+            break
+
+    return True
@@ -0,0 +1,41 @@
+from concurrent.futures import ThreadPoolExecutor
+
+POLL_INTERVAL_MS = 20
+
+class Prerenderer:
+    def __init__(self, root, atlas, workers=None):
+        self.root = root
+        self.atlas = atlas
+        self.executor = ThreadPoolExecutor(max_workers=workers)
+        self.generation = 0
+
+    def start(self, keys, on_done):
+        # Imported here so NumPy stays off the startup path
+        from composite import renderItemBatch, groupRenderKeys
+
+        # Starting a new batch supersedes any batch still in flight
+        self.generation += 1
+        futures = {}
+        for (filepath, scale), variants in groupRenderKeys(keys).items():
+            future = self.executor.submit(renderItemBatch, self.atlas, filepath, scale, variants)
+            futures[(filepath, scale)] = (variants, future)
+        self.root.after(POLL_INTERVAL_MS, self.poll, self.generation, futures, on_done)
+
+    def poll(self, generation, futures, on_done):
+        if generation != self.generation:
+            for (_, future) in futures.values():
+                future.cancel()
+            return
+        if not all(future.done() for (_, future) in futures.values()):
+            self.root.after(POLL_INTERVAL_MS, self.poll, generation, futures, on_done)
+            return
+
+        images = {}
+        for (filepath, scale), (variants, future) in futures.items():
+            for variant, img in zip(variants, future.result()):
+                images[(filepath, scale) + variant] = img
+        on_done(images)
+
+    def shutdown(self):
+        self.generation += 1
+        self.executor.shutdown(wait=False, cancel_futures=True)
@@ -0,0 +1,230 @@
+import bisect
+import os
+import struct
+import time
+
+from journal import applyRecord
+from stateformat import encodeState, decodeState, StateFormatError
+
+RUNS_DIR = 'runs'
+RUN_EXTENSION = '.midnarun'
+MAGIC = b'MRUN'
+INDEX_MAGIC = b'MIDX'
+FORMAT_VERSION = 1
+KEYFRAME_INTERVAL = 60.0
+KEYFRAME_EVENTS = 256
+
+HEADER = struct.Struct('<4sBxxxd')
+EVENT = struct.Struct('<cI')
+VALUE = struct.Struct('<HHH')
+MOVE = struct.Struct('<HHHH')
+LENGTH = struct.Struct('<I')
+INDEX_ENTRY = struct.Struct('<IQ')
+TRAILER = struct.Struct('<Q4s')
+
+# A run is a header, then events: a kind byte and the milliseconds since the
+# run started, followed by the payload for that kind. Keyframes hold the whole
+# state in the binary state format, so seeking only replays the events after
+# the closest one. A clean close appends an index of the keyframes.
+KEYFRAME = b'K'
+SET_VALUE = b's'
+MOVE_ITEMS = b'm'
+INDEX = b'X'
+
+class RunFormatError(ValueError):
+    pass
+
+def getRunPath(runs_dir=RUNS_DIR):
+    return os.path.join(runs_dir, time.strftime('run-%Y%m%d-%H%M%S') + RUN_EXTENSION)
+
+class Recorder:
+    def __init__(self, state, path):
+        self.state = state
+        self.path = path
+        self.outfile = None
+        self.started = None
+        self.keyframes = []
+        self.last_keyframe = 0
+        self.events = 0
+        self.error = None
+
+    def start(self):
+        os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+        self.outfile = open(self.path, 'wb')
+        self.started = time.monotonic()
+        self.outfile.write(HEADER.pack(MAGIC, FORMAT_VERSION, time.time()))
+        self.keyframe()
+
+    def elapsed(self):
+        return int((time.monotonic() - self.started) * 1000)
+
+    def recordValue(self, x, y, value):
+        self.append(SET_VALUE, VALUE.pack(x, y, value))
+
+    def recordMove(self, x1, y1, x2, y2):
+        self.append(MOVE_ITEMS, MOVE.pack(x1, y1, x2, y2))
+
+    def append(self, kind, payload):
+        if self.outfile is None:
+            return
+
+        now = self.elapsed()
+        self.outfile.write(EVENT.pack(kind, now) + payload)
+        self.events += 1
+        if self.events >= KEYFRAME_EVENTS or now - self.last_keyframe >= KEYFRAME_INTERVAL * 1000:
+            self.keyframe()
+
+    def keyframe(self):
+        if self.outfile is None:
+            return
+
+        now = self.elapsed()
+        try:
+            data = encodeState(self.state.serializeState())
+        except StateFormatError as error:
+            # Later events would replay onto the wrong state, so end the run
+            # here and keep what was recorded so far
+            self.error = error
+            self.close()
+            return
+        self.keyframes.append((now, self.outfile.tell()))
+        self.outfile.write(EVENT.pack(KEYFRAME, now) + LENGTH.pack(len(data)) + data)
+        # Everything up to a keyframe survives a crash
+        self.outfile.flush()
+        self.last_keyframe = now
+        self.events = 0
+
+    def close(self):
+        if self.outfile is None:
+            return
+
+        offset = self.outfile.tell()
+        index = b''.join(INDEX_ENTRY.pack(*keyframe) for keyframe in self.keyframes)
+        self.outfile.write(EVENT.pack(INDEX, self.elapsed()) + LENGTH.pack(len(self.keyframes)) + index)
+        self.outfile.write(TRAILER.pack(offset, INDEX_MAGIC))
+        self.outfile.close()
+        self.outfile = None
+
+class RunReader:
+    # Reads a recorded run for replay. Seeking loads the closest keyframe at
+    # or before the requested time and replays the events after it.
+    def __init__(self, path):
+        with open(path, 'rb') as infile:
+            self.data = infile.read()
+        if len(self.data) < HEADER.size:
+            raise RunFormatError(f'{path} is too short to be a recorded run')
+        (magic, version, self.started_at) = HEADER.unpack_from(self.data)
+        if magic != MAGIC:
+            raise RunFormatError(f'{path} is not a recorded run')
+        if version != FORMAT_VERSION:
+            raise RunFormatError(f'Unsupported run version {version}')
+
+        self.end = len(self.data)
+        self.keyframes = self.readIndex()
+        if self.keyframes is None:
+            # No index after a crash, find the keyframes by walking the events
+            self.keyframes = [(time_ms, offset) for (kind, time_ms, offset, _) in self.scan(HEADER.size)
+                              if kind == KEYFRAME]
+        if not self.keyframes:
+            raise RunFormatError(f'{path} has no keyframes')
+        self.keyframe_times = [time_ms for (time_ms, _) in self.keyframes]
+        self.event_times = [time_ms for (kind, time_ms, _, _) in self.scan(HEADER.size)
+                            if kind != KEYFRAME]
+        self.duration = max(self.event_times[-1:] + self.keyframe_times[-1:])
+        self.cached = None
+        self.position = None
+
+    def readIndex(self):
+        if len(self.data) < HEADER.size + TRAILER.size:
+            return None
+        (offset, magic) = TRAILER.unpack_from(self.data, len(self.data) - TRAILER.size)
+        if magic != INDEX_MAGIC or offset >= len(self.data):
+            return None
+
+        (count,) = LENGTH.unpack_from(self.data, offset + EVENT.size)
+        start = offset + EVENT.size + LENGTH.size
+        self.end = offset
+
+        return [INDEX_ENTRY.unpack_from(self.data, start + i * INDEX_ENTRY.size) for i in range(count)]
+
+    def scan(self, offset, until=None):
+        # Yields (kind, time, offset, payload) for every complete event
+        data = self.data
+        while offset + EVENT.size <= self.end:
+            (kind, time_ms) = EVENT.unpack_from(data, offset)
+            if until is not None and time_ms > until:
+                return
+            start = offset + EVENT.size
+            if kind == SET_VALUE:
+                size = VALUE.size
+            elif kind == MOVE_ITEMS:
+                size = MOVE.size
+            elif kind == KEYFRAME and start + LENGTH.size <= self.end:
+                size = LENGTH.size + LENGTH.unpack_from(data, start)[0]
+            else:
+                # The index, or an event torn by a crash
+                return
+            if start + size > self.end:
+                return
+            yield (kind, time_ms, offset, data[start:start + size])
+            offset = start + size
+
+    def loadKeyframe(self, state, offset):
+        (_, _, _, payload) = next(self.scan(offset))
+        try:
+            state.updateItems(decodeState(payload[LENGTH.size:])['items'])
+        except StateFormatError as error:
+            raise RunFormatError(f'Damaged keyframe: {error}')
+
+    def seek(self, state, time_ms):
+        # Sets state to how the run looked at time_ms. State is expected to be
+        # left alone between seeks, so moving forward without passing a
+        # keyframe only replays the events since the last seek.
+        i = max(0, bisect.bisect_right(self.keyframe_times, time_ms) - 1)
+        offset = self.keyframes[i][1]
+        if self.position and self.position[0] == offset and self.position[1] <= time_ms:
+            start = self.position[2]
+        else:
+            if self.cached is None or self.cached[0] != offset:
+                self.loadKeyframe(state, offset)
+                self.cached = (offset, state.snapshot())
+            else:
+                state.restore(self.cached[1])
+            (length,) = LENGTH.unpack_from(self.data, offset + EVENT.size)
+            start = offset + EVENT.size + LENGTH.size + length
+
+        end = start
+        for (kind, _, event_offset, payload) in self.scan(start, until=time_ms):
+            applyEvent(state.items, kind, payload)
+            end = event_offset + EVENT.size + len(payload)
+        self.position = (offset, time_ms, end)
+
+    def getEventTime(self, time_ms, step):
+        # The time of the event before or after time_ms
+        if step < 0:
+            i = bisect.bisect_left(self.event_times, time_ms) - 1
+            return self.event_times[i] if i >= 0 else 0
+        i = bisect.bisect_right(self.event_times, time_ms)
+
+        return self.event_times[i] if i < len(self.event_times) else self.duration
+
+    def events(self):
+        # Yields (time, kind, payload) for every change in the run
+        for (kind, time_ms, _, payload) in self.scan(HEADER.size):
+            if kind != KEYFRAME:
+                yield (time_ms, kind, payload)
+
+def applyEvent(items, kind, payload):
+    if kind == SET_VALUE:
+        applyRecord(items, ('s',) + VALUE.unpack(payload))
+    elif kind == MOVE_ITEMS:
+        applyRecord(items, ('m',) + MOVE.unpack(payload))
+    elif kind == KEYFRAME:
+        # Loads, clears and undone snapshots are recorded as keyframes
+        pass
+
+def formatTime(time_ms):
+    seconds = time_ms // 1000
+    (hours, minutes) = (seconds // 3600, seconds // 60 % 60)
+
+    return f'{hours}:{minutes:02}:{seconds % 60:02}.{time_ms % 1000 // 100}'
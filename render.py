@@ -0,0 +1,30 @@
+from badges import renderBadge
+from instrument import timed
+
+DARKEN_FACTOR = 0.4
+
+def renderItemImage(atlas, filepath, scale, badge, isDark, resample=None):
+    # Pillow is imported on first use to keep it off the startup path
+    from PIL import Image, ImageEnhance
+
+    if resample is None:
+        resample = Image.LANCZOS
+
+    # Times its own render.open and render.resize stages
+    img = atlas.resized(filepath, scale, resample)
+
+    # Handle wallets as a special case
+    if 'wallet' in filepath:
+        return img
+
+    if badge:
+        with timed('render.badge'):
+            num_img = renderBadge(atlas, badge, scale, resample)
+        with timed('render.composite'):
+            img.paste(num_img, (0, 0), num_img)
+    if isDark:
+        with timed('render.enhance'):
+            darken = ImageEnhance.Brightness(img)
+            img = darken.enhance(DARKEN_FACTOR)
+
+    return img
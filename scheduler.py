@@ -0,0 +1,60 @@
+import time
+
+from instrument import timed
+
+FRAME_MS = 16
+
+class RepaintScheduler:
+    # Collects dirty cells and paints each of them once per frame, so a burst
+    # of state changes only ever renders the final state of every cell
+    def __init__(self, root, paint_cell, paint_all):
+        self.root = root
+        self.paint_cell = paint_cell
+        self.paint_all = paint_all
+        self.dirty = set()
+        self.full = False
+        self.job = None
+        self.last_flush = 0.0
+
+    def markCell(self, x, y):
+        self.dirty.add((x, y))
+        self.schedule()
+
+    def markAll(self):
+        self.full = True
+        self.schedule()
+
+    def schedule(self):
+        if self.job is not None:
+            return
+
+        # Paint on the next idle if a frame has already passed since the last
+        # paint, otherwise wait for the frame boundary
+        wait_ms = int(FRAME_MS - (time.perf_counter() - self.last_flush) * 1000)
+        if wait_ms > 0:
+            self.job = self.root.after(wait_ms, self.flush)
+        else:
+            self.job = self.root.after_idle(self.flush)
+
+    def flush(self):
+        if self.job is not None:
+            self.root.after_cancel(self.job)
+            self.job = None
+        self.last_flush = time.perf_counter()
+
+        (dirty, full) = (self.dirty, self.full)
+        self.dirty = set()
+        self.full = False
+        with timed('repaint'):
+            if full:
+                self.paint_all()
+            else:
+                for (x, y) in dirty:
+                    self.paint_cell(x, y)
+
+    def cancel(self):
+        if self.job is not None:
+            self.root.after_cancel(self.job)
+            self.job = None
+        self.dirty.clear()
+        self.full = False
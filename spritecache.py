@@ -0,0 +1,185 @@
+import hashlib
+import os
+import sys
+import tempfile
+import threading
+
+from atlas import getSourceStamp
+from instrument import timed
+
+CACHE_VERSION = 1
+CACHE_SIZE_MB = 64
+MIPMAP_MIN = 8
+
+def getCacheDir():
+    override = os.environ.get('MIDNA_CACHE_DIR')
+    if override:
+        return override
+    if sys.platform == 'win32':
+        base = os.environ.get('LOCALAPPDATA', os.path.expanduser('~'))
+    elif sys.platform == 'darwin':
+        base = os.path.expanduser('~/Library/Caches')
+    else:
+        base = os.environ.get('XDG_CACHE_HOME', os.path.expanduser('~/.cache'))
+
+    return os.path.join(base, 'midna', 'sprites')
+
+class SpriteDiskCache:
+    # Resized sprites and count overlays kept on disk between runs. Entries are
+    # keyed by the source file's mtime and size, the target size and the
+    # resampling filter, so an edited sprite simply misses. Exact sizes are
+    # stored as rendered; a mipmap pyramid of halved levels serves the cheap
+    # non-default filters (slider previews) from the nearest larger level.
+    def __init__(self, atlas, cache_dir=None, max_bytes=CACHE_SIZE_MB * 1024 * 1024):
+        self.atlas = atlas
+        self.cache_dir = cache_dir or getCacheDir()
+        self.max_bytes = max_bytes
+        self.stamps = {}
+        self.levels = {}
+        self.total_bytes = None
+        self.lock = threading.Lock()
+
+    def resized(self, path, scale, resample, default_resample):
+        if resample != default_resample:
+            level = self.getLevel(path, scale, default_resample)
+            with timed('render.resize'):
+                return level.resize((scale, scale), resample)
+
+        return self.getEntry(path, 'exact', scale, resample)
+
+    def getLevel(self, path, scale, resample):
+        # The smallest mipmap level that is still at least as large as scale
+        source_size = self.getSourceSize(path)
+        size = source_size
+        while size // 2 >= max(scale, MIPMAP_MIN):
+            size //= 2
+        if size == source_size:
+            with timed('render.open'):
+                return self.atlas.open(path)
+
+        key = (path, size)
+        level = self.levels.get(key)
+        if level is None:
+            level = self.getEntry(path, 'mip', size, resample)
+            self.levels[key] = level
+
+        return level
+
+    def getSourceSize(self, path):
+        self.getStamp(path)
+
+        return self.stamps[path][1]
+
+    def getStamp(self, path):
+        entry = self.stamps.get(path)
+        if entry is None:
+            try:
+                stamp = getSourceStamp(path)
+            except FileNotFoundError:
+                # Only packed into the atlas, the atlas sheet stands in
+                stamp = getSourceStamp(self.atlas.image_path)
+            img = self.atlas.open(path)
+            entry = (stamp, max(img.size))
+            self.stamps[path] = entry
+
+        return entry[0]
+
+    def getFilename(self, path, kind, size, resample):
+        stamp = self.getStamp(path)
+        key = f'{CACHE_VERSION}:{path}:{stamp[0]}:{stamp[1]}:{kind}:{size}:{int(resample)}'
+        digest = hashlib.sha1(key.encode()).hexdigest()
+
+        return os.path.join(self.cache_dir, digest[:2], f'{digest}.png')
+
+    def getEntry(self, path, kind, size, resample):
+        filename = self.getFilename(path, kind, size, resample)
+        with timed('render.open'):
+            img = self.loadEntry(filename)
+        if img is None:
+            with timed('render.resize'):
+                img = self.atlas.open(path).resize((size, size), resample)
+            self.write(filename, img)
+
+        return img
+
+    def loadEntry(self, filename):
+        from PIL import Image
+
+        try:
+            img = Image.open(filename)
+            img.load()
+            os.utime(filename)
+            return img
+        except FileNotFoundError:
+            pass
+        except (OSError, SyntaxError, ValueError):
+            # Unreadable entry, drop it and render again
+            self.remove(filename)
+
+        return None
+
+    def write(self, filename, img):
+        # Write to a temporary file in the same directory and rename it over
+        # the entry, so readers never see a partly written PNG
+        directory = os.path.dirname(filename)
+        try:
+            os.makedirs(directory, exist_ok=True)
+            (fd, temp_path) = tempfile.mkstemp(dir=directory, suffix='.tmp')
+            with os.fdopen(fd, 'wb') as outfile:
+                img.save(outfile, 'PNG', compress_level=1)
+            os.replace(temp_path, filename)
+        except OSError:
+            # A read-only or full cache dir only costs the speedup
+            return
+
+        self.addBytes(os.path.getsize(filename))
+
+    def remove(self, filename):
+        try:
+            os.remove(filename)
+        except OSError:
+            pass
+
+    def listEntries(self):
+        entries = []
+        for dirpath, _, filenames in os.walk(self.cache_dir):
+            for filename in filenames:
+                path = os.path.join(dirpath, filename)
+                try:
+                    stat = os.stat(path)
+                except OSError:
+                    continue
+                if filename.endswith('.tmp'):
+                    # Left behind by an interrupted write
+                    self.remove(path)
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, path))
+
+        return entries
+
+    def addBytes(self, size):
+        with self.lock:
+            if self.total_bytes is None:
+                self.total_bytes = sum(entry[1] for entry in self.listEntries())
+            else:
+                self.total_bytes += size
+            if self.total_bytes > self.max_bytes:
+                self.trim()
+
+    def trim(self):
+        # Evict the least recently used entries down to 3/4 of the cap
+        entries = sorted(self.listEntries())
+        self.total_bytes = sum(entry[1] for entry in entries)
+        target = self.max_bytes * 3 // 4
+        for _, size, path in entries:
+            if self.total_bytes <= target:
+                break
+            self.remove(path)
+            self.total_bytes -= size
+
+    def clear(self):
+        with self.lock:
+            for _, _, path in self.listEntries():
+                self.remove(path)
+            self.levels.clear()
+            self.total_bytes = 0
@@ -0,0 +1,185 @@
+import json
+import struct
+import zlib
+
+from writer import writeFileAtomic
+
+MAGIC = b'MIDN'
+FORMAT_VERSION = 1
+BINARY_EXTENSION = '.midna'
+
+HEADER = struct.Struct('<4sBxH')
+COUNT = struct.Struct('<H')
+TABLE_SIZE = struct.Struct('<I')
+CHECKSUM = struct.Struct('<I')
+MAX_STRING_BYTES = 0xFFFF
+
+TYPE_CODES = { 'Item': 0, 'ProgressiveItem': 1, 'ToggleItem': 2, 'NumberedItem': 3 }
+TYPE_NAMES = { code: name for name, code in TYPE_CODES.items() }
+
+class StateFormatError(ValueError):
+    pass
+
+class StringTable:
+    def __init__(self):
+        self.strings = []
+        self.indices = {}
+
+    def index(self, string):
+        index = self.indices.get(string)
+        if index is None:
+            data = string.encode('utf-8')
+            # Lengths are stored as a COUNT, so they have to fit one
+            if len(data) > MAX_STRING_BYTES:
+                raise StateFormatError(f'A string of {len(data)} bytes is too long for the binary format')
+            index = len(self.strings)
+            self.strings.append(data)
+            self.indices[string] = index
+
+        return index
+
+    def encode(self):
+        parts = [TABLE_SIZE.pack(len(self.strings))]
+        for data in self.strings:
+            parts.append(COUNT.pack(len(data)))
+            parts.append(data)
+
+        return b''.join(parts)
+
+def encodeCell(cell, strings):
+    item_type = cell['type']
+    if item_type not in TYPE_CODES:
+        raise StateFormatError(f'Item type {item_type} cannot be encoded')
+
+    values = [TYPE_CODES[item_type], strings.index(cell['itemText'])]
+    if item_type == 'Item':
+        values.append(strings.index(cell['name']))
+    elif item_type == 'ProgressiveItem':
+        values.append(len(cell['states']))
+        values.extend(strings.index(state) for state in cell['states'])
+        values.append(cell['current_state'])
+    elif item_type == 'ToggleItem':
+        values += [strings.index(cell['name']), cell['current_state']]
+    elif item_type == 'NumberedItem':
+        values += [strings.index(cell['name']), cell['max_num'], cell['current_num']]
+
+    return values
+
+def encodeState(tracker_state):
+    strings = StringTable()
+    values = [len(tracker_state['items'])]
+    for row in tracker_state['items']:
+        values.append(len(row))
+        for cell in row:
+            values.extend(encodeCell(cell, strings))
+
+    try:
+        cells = struct.pack(f'<{len(values)}H', *values)
+    except struct.error:
+        raise StateFormatError('A value in the state is too large for the binary format')
+    body = HEADER.pack(MAGIC, FORMAT_VERSION, 0) + strings.encode() + cells
+
+    return body + CHECKSUM.pack(zlib.crc32(body))
+
+class Reader:
+    def __init__(self, data, offset):
+        self.data = data
+        self.offset = offset
+
+    def read(self, layout):
+        if self.offset + layout.size > len(self.data):
+            raise StateFormatError('Binary state ends unexpectedly')
+        values = layout.unpack_from(self.data, self.offset)
+        self.offset += layout.size
+
+        return values[0] if len(values) == 1 else values
+
+    def readCount(self):
+        return self.read(COUNT)
+
+    def readBytes(self, length):
+        if self.offset + length > len(self.data):
+            raise StateFormatError('Binary state ends unexpectedly')
+        data = self.data[self.offset:self.offset + length]
+        self.offset += length
+
+        return data
+
+def decodeCell(reader, strings):
+    def string():
+        index = reader.readCount()
+        if index >= len(strings):
+            raise StateFormatError(f'String index {index} is out of range')
+        return strings[index]
+
+    code = reader.readCount()
+    if code not in TYPE_NAMES:
+        raise StateFormatError(f'Unknown item type code {code}')
+    cell = { 'type': TYPE_NAMES[code], 'itemText': string() }
+    if code == TYPE_CODES['Item']:
+        cell['name'] = string()
+    elif code == TYPE_CODES['ProgressiveItem']:
+        cell['states'] = [string() for _ in range(reader.readCount())]
+        cell['current_state'] = reader.readCount()
+    elif code == TYPE_CODES['ToggleItem']:
+        cell['name'] = string()
+        cell['current_state'] = reader.readCount()
+    elif code == TYPE_CODES['NumberedItem']:
+        cell['name'] = string()
+        cell['max_num'] = reader.readCount()
+        cell['current_num'] = reader.readCount()
+
+    return cell
+
+def decodeState(data):
+    if len(data) < HEADER.size + CHECKSUM.size:
+        raise StateFormatError('Binary state is too short')
+    body = data[:-CHECKSUM.size]
+    (checksum,) = CHECKSUM.unpack_from(data, len(body))
+    if zlib.crc32(body) != checksum:
+        raise StateFormatError('Binary state checksum does not match, the file is corrupt')
+
+    (magic, version, _) = HEADER.unpack_from(body)
+    if magic != MAGIC:
+        raise StateFormatError('Not a midna binary state')
+    if version != FORMAT_VERSION:
+        raise StateFormatError(f'Unsupported binary state version {version}')
+
+    reader = Reader(body, HEADER.size)
+    strings = [reader.readBytes(reader.readCount()).decode('utf-8')
+               for _ in range(reader.read(TABLE_SIZE))]
+    items = []
+    for _ in range(reader.readCount()):
+        items.append([decodeCell(reader, strings) for _ in range(reader.readCount())])
+
+    return { 'items': items }
+
+def isBinaryPath(filepath):
+    return filepath.endswith(BINARY_EXTENSION)
+
+def loadStateFile(filepath):
+    # The format is detected from the content, not the file name
+    with open(filepath, 'rb') as infile:
+        data = infile.read()
+    if data.startswith(MAGIC):
+        return decodeState(data)
+
+    try:
+        tracker_state = json.loads(data)
+    except ValueError as error:
+        raise StateFormatError(f'{filepath} is not a valid state file: {error}')
+    if not isinstance(tracker_state, dict) or not isinstance(tracker_state.get('items'), list):
+        raise StateFormatError(f'{filepath} is not a valid state file: it needs a list of items')
+    if not isinstance(tracker_state.get('types', {}), dict):
+        raise StateFormatError(f'{filepath} is not a valid state file: types must be a table')
+
+    return tracker_state
+
+def encodeStateFile(filepath, tracker_state):
+    if isBinaryPath(filepath):
+        return encodeState(tracker_state)
+
+    return json.dumps(tracker_state, indent=4).encode('utf-8')
+
+def saveStateFile(filepath, tracker_state):
+    writeFileAtomic(filepath, encodeStateFile(filepath, tracker_state))
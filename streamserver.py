@@ -0,0 +1,248 @@
+import io
+import json
+import os
+import queue
+import re
+import threading
+import time
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+BATCH_INTERVAL = 0.05
+KEEPALIVE_INTERVAL = 15
+CLIENT_QUEUE_SIZE = 256
+STATIC_DIRS = ['img/items/', 'img/counts/']
+BADGE_DIR = 'badge/'
+BADGE_NAME = re.compile(r'^[0-9]{1,6}(max)?$')
+
+OVERLAY_PAGE = '''<!DOCTYPE html>
+<html>
+<head>
+<meta charset="utf-8">
+<title>midna</title>
+<style>
+  body { margin: 0; background: transparent; font: 8pt 'Liberation Mono', monospace; color: #d98e00; }
+  #grid { display: grid; gap: 0; }
+  .cell { position: relative; text-align: center; }
+  .cell img { display: block; width: 100%; }
+  .cell .overlay { position: absolute; top: 0; left: 0; }
+  .dark img { filter: brightness(0.4); }
+</style>
+</head>
+<body>
+<div id="grid"></div>
+<script>
+const grid = document.getElementById('grid');
+let cells = [];
+
+function paint(x, y, cell) {
+  const el = cells[y][x];
+  el.className = cell.dark ? 'cell dark' : 'cell';
+  el.innerHTML = '<img src="/' + cell.image + '">'
+    + (cell.overlay ? '<img class="overlay" src="/' + cell.overlay + '">' : '')
+    + '<div>' + cell.text + '</div>';
+}
+
+function layout(state) {
+  grid.innerHTML = '';
+  grid.style.gridTemplateColumns = 'repeat(' + Math.max(0, ...state.map(r => r.length)) + ', 60px)';
+  cells = state.map((row, y) => row.map((cell, x) => {
+    const el = document.createElement('div');
+    grid.appendChild(el);
+    return el;
+  }));
+  state.forEach((row, y) => row.forEach((cell, x) => { if (cell) paint(x, y, cell); }));
+}
+
+const events = new EventSource('/events');
+events.addEventListener('state', e => layout(JSON.parse(e.data)));
+events.addEventListener('delta', e => JSON.parse(e.data).forEach(d => paint(d.x, d.y, d.cell)));
+</script>
+</body>
+</html>
+'''
+
+class StreamServer:
+    def __init__(self, host, port):
+        self.cells = []
+        self.clients = set()
+        self.lock = threading.Lock()
+        self.updates = queue.SimpleQueue()
+        self.running = True
+        self.badges = {}
+        self.badge_lock = threading.Lock()
+        self.atlas = None
+
+        self.httpd = ThreadingHTTPServer((host, port), StreamRequestHandler)
+        self.httpd.daemon_threads = True
+        self.httpd.stream_server = self
+        self.address = self.httpd.server_address
+
+        threading.Thread(target=self.httpd.serve_forever, daemon=True).start()
+        threading.Thread(target=self.broadcast, daemon=True).start()
+
+    def getBadgePath(self, badge):
+        return f'{BADGE_DIR}{badge}.png'
+
+    def getBadgePNG(self, badge):
+        # Count badges are drawn on demand at full size and kept as PNG bytes
+        from atlas import SpriteAtlas
+        from badges import renderBadge, SOURCE_SIZE
+
+        with self.badge_lock:
+            data = self.badges.get(badge)
+            if data is None:
+                if self.atlas is None:
+                    self.atlas = SpriteAtlas.load()
+                buffer = io.BytesIO()
+                renderBadge(self.atlas, badge, SOURCE_SIZE).save(buffer, 'PNG')
+                data = buffer.getvalue()
+                self.badges[badge] = data
+
+        return data
+
+    # Called from the Tk thread, these never block
+    def publishLayout(self, shape):
+        self.updates.put(('layout', shape))
+
+    def publishCell(self, x, y, cell):
+        self.updates.put(('cell', x, y, cell))
+
+    def broadcast(self):
+        while self.running:
+            try:
+                updates = [self.updates.get(timeout=KEEPALIVE_INTERVAL)]
+            except queue.Empty:
+                continue
+            # Gather everything that arrives within one batch window
+            time.sleep(BATCH_INTERVAL)
+            while True:
+                try:
+                    updates.append(self.updates.get_nowait())
+                except queue.Empty:
+                    break
+            self.applyUpdates(updates)
+
+    def applyUpdates(self, updates):
+        relayout = False
+        deltas = {}
+        with self.lock:
+            for update in updates:
+                if update[0] == 'layout':
+                    self.cells = [[None] * columns for columns in update[1]]
+                    relayout = True
+                    deltas.clear()
+                else:
+                    (_, x, y, cell) = update
+                    if y < len(self.cells) and x < len(self.cells[y]):
+                        self.cells[y][x] = cell
+                        deltas[(x, y)] = cell
+
+            if relayout:
+                message = formatEvent('state', self.cells)
+            elif not deltas:
+                return
+            else:
+                message = formatEvent('delta', [{ 'x': x, 'y': y, 'cell': cell }
+                                                 for (x, y), cell in deltas.items()])
+            for client in list(self.clients):
+                try:
+                    client.put_nowait(message)
+                except queue.Full:
+                    # Too far behind, drop it so it reconnects and gets a fresh state
+                    self.clients.discard(client)
+                    dropClient(client)
+
+    def addClient(self):
+        client = queue.Queue(maxsize=CLIENT_QUEUE_SIZE)
+        with self.lock:
+            self.clients.add(client)
+            initial = formatEvent('state', self.cells)
+
+        return (client, initial)
+
+    def removeClient(self, client):
+        with self.lock:
+            self.clients.discard(client)
+
+    def getState(self):
+        with self.lock:
+            return json.dumps(self.cells)
+
+    def shutdown(self):
+        self.running = False
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+def dropClient(client):
+    while True:
+        try:
+            client.get_nowait()
+        except queue.Empty:
+            break
+    client.put_nowait(None)
+
+def formatEvent(event, data):
+    return f'event: {event}\ndata: {json.dumps(data, separators=(",", ":"))}\n\n'.encode()
+
+class StreamRequestHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        server = self.server.stream_server
+        path = self.path.split('?')[0]
+        if path == '/':
+            self.sendBody(OVERLAY_PAGE.encode(), 'text/html; charset=utf-8')
+        elif path == '/state':
+            self.sendBody(server.getState().encode(), 'application/json')
+        elif path == '/events':
+            self.streamEvents(server)
+        elif path.startswith(f'/{BADGE_DIR}') and path.endswith('.png') \
+                and BADGE_NAME.match(path[len(BADGE_DIR) + 1:-len('.png')]):
+            self.sendBody(server.getBadgePNG(path[len(BADGE_DIR) + 1:-len('.png')]), 'image/png')
+        elif any(path.startswith(f'/{static_dir}') for static_dir in STATIC_DIRS) \
+                and path.endswith('.png') and '..' not in path:
+            self.sendFile(path[1:])
+        else:
+            self.send_error(404)
+
+    def sendBody(self, body, content_type):
+        self.send_response(200)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        self.send_header('Access-Control-Allow-Origin', '*')
+        self.end_headers()
+        self.wfile.write(body)
+
+    def sendFile(self, path):
+        if not os.path.isfile(path):
+            self.send_error(404)
+            return
+        with open(path, 'rb') as infile:
+            self.sendBody(infile.read(), 'image/png')
+
+    def streamEvents(self, server):
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/event-stream')
+        self.send_header('Cache-Control', 'no-cache')
+        self.send_header('Access-Control-Allow-Origin', '*')
+        self.end_headers()
+
+        (client, initial) = server.addClient()
+        try:
+            self.wfile.write(initial)
+            self.wfile.flush()
+            while server.running:
+                try:
+                    message = client.get(timeout=KEEPALIVE_INTERVAL)
+                except queue.Empty:
+                    message = b': keepalive\n\n'
+                if message is None:
+                    break
+                self.wfile.write(message)
+                self.wfile.flush()
+        except (BrokenPipeError, ConnectionResetError):
+            pass
+        finally:
+            server.removeClient(client)
+
+    def log_message(self, format, *args):
+        # Keep the tracker's terminal quiet
+        pass
@@ -1,21 +1,50 @@
 import copy
 import json
 import os
+import time
+from array import array
 
 from tkinter import *
 from tkinter import colorchooser
 from tkinter import font
 from tkinter.filedialog import asksaveasfilename, askopenfilename
 from tkinter.messagebox import askyesno, showerror
-from PIL import ImageTk, Image, ImageEnhance
 
-from items import Item, ProgressiveItem, ToggleItem, NumberedItem, convertJSONtoItems
-
-COUNTS_DIR = 'img/counts/'
-DARKEN_FACTOR = 0.4
+from atlas import SpriteAtlas
+from badges import getBadgeName
+from autotracker import AutoTracker, AutoTrackerError, loadAutoTrackerConfig
+from grid import ButtonGrid, CanvasGrid, VirtualGrid, TRACKER_FONT
+from history import History
+from imagecache import ImageCache
+from instrument import timed, formatReport, dumpReport
+from items import NumberedItem
+from items import buildItems, packItems, rebindItems, VALUE_TYPE
+from journal import Journal
+from stateformat import loadStateFile, encodeStateFile, StateFormatError
+from prerender import Prerenderer
+from recording import Recorder, RunReader, RunFormatError, getRunPath, formatTime, RUNS_DIR
+from render import renderItemImage
+from scheduler import RepaintScheduler
+from spritecache import SpriteDiskCache, CACHE_SIZE_MB
+from writer import BackgroundWriter
+
+IMAGE_CACHE_SIZE = 512
 IMAGE_SCALE_MIN = 10
 IMAGE_SCALE_MAX = 120
-TRACKER_FONT = ('Liberation Mono', 8)
+PREVIEW_FRAME_MS = 16
+PREVIEW_BUDGET = 0.008
+SETTLE_DELAY_MS = 250
+LATENCY_REFRESH_MS = 500
+FILL_BUDGET = 0.012
+CONFIG_FILE = 'config.json'
+CONFIG_POLL_MS = 1000
+COLOR_KEYS = ['Foreground', 'ForegroundAlt', 'Background', 'Focus',
+              'Accent1', 'Accent2', 'Accent3', 'Accent4']
+AUTOTRACK_APPLY_MS = 100
+WRITE_ERROR_POLL_MS = 500
+
+STATE_FILETYPES = [('JSON File','*.json'),('Midna Binary State','*.midna'),('All Files','*.*')]
+RUN_FILETYPES = [('Midna Run','*.midnarun'),('All Files','*.*')]
 
 FULL_SPAN = 6
 HALF_SPAN = FULL_SPAN // 2
@@ -32,57 +61,174 @@ class Tracker:
         self.root.bind('<Down>',  lambda event: self.moveItem('S'))
         self.root.bind('<Left>',  lambda event: self.moveItem('W'))
         self.root.bind('<Right>', lambda event: self.moveItem('E'))
+        self.root.bind('<Control-z>', lambda event: self.undo())
+        self.root.bind('<Control-y>', lambda event: self.redo())
+        self.root.bind('<Control-Z>', lambda event: self.redo())
+        self.root.bind('<F3>', lambda event: self.toggleLatencyOverlay())
+        self.root.bind('<F5>', lambda event: self.toggleReplay())
 
         self.state = state
         self.config = config
         self.temp_config = copy.deepcopy(self.config)
+        self.themed_widgets = []
+        self.settings = None
+        self.config_stamp = None
         self.image_scale = IntVar(value=config['DefaultImageSize'])
+        self.image_cache = ImageCache(config.get('ImageCacheSize', IMAGE_CACHE_SIZE))
+        self.cached_scale = self.image_scale.get()
+        self.atlas = SpriteAtlas.load()
+        cache_size = config.get('SpriteCacheSize', CACHE_SIZE_MB)
+        if cache_size:
+            self.atlas.disk_cache = SpriteDiskCache(self.atlas, max_bytes=cache_size * 1024 * 1024)
+        self.prerenderer = Prerenderer(self.root, self.atlas)
+        self.writer = BackgroundWriter()
+        self.journal = Journal(self.state, self.writer)
+        self.history = History()
+        self.recorder = Recorder(self.state, getRunPath()) if config.get('RecordRuns', True) else None
+        self.replay = None
+        self.latency_overlay = None
+        self.filling = False
+        self.fill_generation = 0
+        self.repaint = RepaintScheduler(self.root, self.paintDirtyCell, self.paintAllCells)
+        self.on_first_paint = None
+        self.stream_server = None
+        self.published_shape = None
+        if config.get('OverlayServerPort', 0):
+            self.startStreamServer(config.get('OverlayServerHost', '127.0.0.1'), config['OverlayServerPort'])
+        self.auto_tracker = None
+        if config.get('AutoTrackerFile'):
+            self.startAutoTracker(config['AutoTrackerFile'])
+        self.preview_cache = {}
+        self.preview_job = None
+        self.preview_cursor = 0
+        self.preview_scale = None
+        self.settle_job = None
 
     def moveItem(self, direction):
-        (x, y) = self.root.winfo_pointerxy()
-        widget = self.root.winfo_containing(x, y)
-        info = widget.grid_info()
-        row = info['row'] - self.titleBarHeight
-        column = info['column']
+        # The grid tracks which cell is under the pointer as it moves, so
+        # there's no need to query the window system here
+        cell = self.item_grid.hovered
+        if cell is None:
+            return
+        (column, row) = cell
 
         items = self.state.items
-        moved = False
+        target = None
 
         item_range = range(len(items))
         if row in item_range:
-            if direction == 'N' and row != 0:
-                temp = items[row-1][column]
-                items[row-1][column] = items[row][column]
-                items[row][column] = temp
-                moved = True
-            elif direction == 'S' and row != len(items) - 1:
-                temp = items[row+1][column]
-                items[row+1][column] = items[row][column]
-                items[row][column] = temp
-                moved = True
+            if direction == 'N' and row != 0 and column < len(items[row - 1]):
+                target = (column, row - 1)
+            elif direction == 'S' and row != len(items) - 1 and column < len(items[row + 1]):
+                target = (column, row + 1)
             elif direction == 'W' and column != 0:
-                temp = items[row][column-1]
-                items[row][column-1] = items[row][column]
-                items[row][column] = temp
-                moved = True
+                target = (column - 1, row)
             elif direction == 'E' and column != len(items[row]) - 1:
-                temp = items[row][column+1]
-                items[row][column+1] = items[row][column]
-                items[row][column] = temp
-                moved = True
+                target = (column + 1, row)
 
-        if moved:
-            self.constructItemButtons()
+        if target:
+            self.dropItem((column, row), target)
+
+    def dropItem(self, source, target):
+        if self.replay:
+            return
+        (x1, y1) = source
+        (x2, y2) = target
+        self.swapItems(x1, y1, x2, y2)
+        self.history.record(('move', x1, y1, x2, y2))
+        self.repaint.markCell(x1, y1)
+        self.repaint.markCell(x2, y2)
+
+    def swapItems(self, x1, y1, x2, y2):
+        items = self.state.items
+        (items[y1][x1], items[y2][x2]) = (items[y2][x2], items[y1][x1])
+        self.journal.recordMove(x1, y1, x2, y2)
+        if self.recorder:
+            self.recorder.recordMove(x1, y1, x2, y2)
+
+    def undo(self):
+        if self.replay:
+            return
+        change = self.history.undo()
+        if change is not None:
+            self.applyChange(change, reverse=True)
+
+    def redo(self):
+        if self.replay:
+            return
+        change = self.history.redo()
+        if change is not None:
+            self.applyChange(change, reverse=False)
+
+    def applyChange(self, change, reverse):
+        if change[0] == 'value':
+            (_, x, y, before, after) = change
+            self.setItemValue(x, y, before if reverse else after)
+        elif change[0] == 'move':
+            # Swaps are their own inverse
+            (_, x1, y1, x2, y2) = change
+            self.swapItems(x1, y1, x2, y2)
+            self.repaint.markCell(x1, y1)
+            self.repaint.markCell(x2, y2)
+        elif change[0] == 'snapshot':
+            (_, before, after) = change
+            self.restoreSnapshot(before if reverse else after)
+
+    def setItemValue(self, x, y, value):
+        self.state.items[y][x].value = value
+        self.journal.recordSet(x, y, value)
+        if self.recorder:
+            self.recorder.recordValue(x, y, value)
+        self.repaint.markCell(x, y)
+
+    def restoreSnapshot(self, snapshot):
+        self.state.restore(snapshot)
+        self.journal.compact()
+        if self.recorder:
+            self.recorder.keyframe()
+        self.constructItemButtons()
 
     def run(self):
+        if self.config.get('Autosave', True):
+            self.journal.start()
+        if self.recorder:
+            try:
+                self.recorder.start()
+            except OSError as error:
+                showerror('Recording Error', f'Could not record this run: {error}')
+                self.recorder = None
+        if not self.filling:
+            self.prerenderImages()
+        self.config_stamp = self.getConfigStamp()
+        self.root.after(CONFIG_POLL_MS, self.pollConfigFile)
+        self.root.after(WRITE_ERROR_POLL_MS, self.checkWriteErrors)
+        latency_log = os.environ.get('MIDNA_LATENCY_LOG')
+        if latency_log:
+            interval_ms = int(float(os.environ.get('MIDNA_LATENCY_INTERVAL', 10)) * 1000)
+            self.root.after(interval_ms, self.dumpLatencies, latency_log, interval_ms)
         self.root.mainloop()
-
-    def build(self):
+        self.prerenderer.shutdown()
+        self.journal.close()
+        self.writer.shutdown()
+        if self.recorder:
+            self.recorder.close()
+        if self.stream_server:
+            self.stream_server.shutdown()
+        if self.auto_tracker:
+            self.auto_tracker.stop()
+
+    def build(self, progressive=False):
+        if self.replay:
+            self.closeReplay()
         for child in self.root.winfo_children():
             child.destroy()
+        # The latency window went with the rest
+        self.latency_overlay = None
+        self.themed_widgets = []
 
         self.constructTitleBar()
-        self.constructItemButtons()
+        self.constructItemGrid()
+        self.constructItemButtons(progressive)
         self.constructCommandButtons()
         self.constructSliders()
         self.configureRowsAndColumns()
@@ -92,18 +238,173 @@ class Tracker:
         self.titleBarHeight = self.showTitleBar
 
         if self.showTitleBar:
-            title = Label(self.root, text='midna', fg=self.config['ForegroundAlt'],
-                          bg=self.config['Accent3'], font=TRACKER_FONT)
+            title = self.themed(Label(self.root, text='midna', font=TRACKER_FONT),
+                                fg='ForegroundAlt', bg='Accent3')
             title.grid(row=0, column=0, columnspan=FULL_SPAN, sticky='NSEW')
 
-    def constructItemButtons(self):
+    def constructItemGrid(self):
+        renderer = self.config.get('Renderer', 'buttons')
+        if renderer == 'canvas':
+            self.item_grid = CanvasGrid(self.root, self.config, self.titleBarHeight,
+                                        self.forwardState, self.backwardState, self.dropItem, FULL_SPAN)
+        elif renderer == 'virtual':
+            self.item_grid = VirtualGrid(self.root, self.config, self.titleBarHeight, self.forwardState,
+                                         self.backwardState, self.dropItem, FULL_SPAN, self.paintExposedCells)
+        else:
+            self.item_grid = ButtonGrid(self.root, self.config, self.titleBarHeight,
+                                        self.forwardState, self.backwardState, self.dropItem)
+
+    def startStreamServer(self, host, port):
+        from streamserver import StreamServer
+
+        try:
+            self.stream_server = StreamServer(host, port)
+        except OSError as error:
+            showerror('Overlay Server Error', f'Could not start the overlay server on {host}:{port}: {error}')
+
+    def startAutoTracker(self, config_path):
+        try:
+            (dump_path, poll_interval, watches) = loadAutoTrackerConfig(config_path)
+        except AutoTrackerError as error:
+            showerror('Auto-Tracker Error', str(error))
+            return
+
+        self.auto_tracker = AutoTracker(dump_path, watches, poll_interval)
+        self.auto_tracker.start()
+        self.root.after(AUTOTRACK_APPLY_MS, self.applyAutoTrackerChanges)
+
+    def applyAutoTrackerChanges(self):
+        if self.replay:
+            # Changes keep until replay is closed
+            self.root.after(AUTOTRACK_APPLY_MS, self.applyAutoTrackerChanges)
+            return
+        changes = self.auto_tracker.takeChanges()
+        items = self.state.items
+        for watch, raw in changes.items():
+            for y in range(len(items)):
+                for x in range(len(items[y])):
+                    item = items[y][x]
+                    if not watch.matches(item):
+                        continue
+                    value = watch.getValue(raw, item)
+                    if value is not None and value != item.value:
+                        self.history.record(('value', x, y, item.value, value))
+                        self.setItemValue(x, y, value)
+        self.root.after(AUTOTRACK_APPLY_MS, self.applyAutoTrackerChanges)
+
+    def constructItemButtons(self, progressive=False):
+        items = self.state.items
+        shape = tuple(len(row) for row in items)
+        scale = self.image_scale.get()
+        self.item_grid.layout(shape, scale)
+        if self.stream_server and shape != self.published_shape:
+            self.stream_server.publishLayout(shape)
+            self.published_shape = shape
+
+        if not progressive:
+            self.repaint.markAll()
+            return
+
+        # Show the frame with blank cells right away, then fill in the images
+        # a few at a time, visible cells first
+        self.fill_generation += 1
+        cells = self.getPaintOrder()
+        self.placeholder = PhotoImage(width=scale, height=scale)
+        for (x, y) in cells:
+            self.item_grid.render(x, y, self.placeholder, items[y][x].itemText)
+        self.filling = True
+        self.root.after_idle(self.fillCells, self.fill_generation, cells, 0)
+
+    def getPaintOrder(self):
+        items = self.state.items
+        cells = self.item_grid.visibleCells()
+        visible = set(cells)
+        cells += [(x, y) for y in range(len(items)) for x in range(len(items[y]))
+                  if (x, y) not in visible]
+
+        return cells
+
+    def paintAllCells(self):
+        # Any fill still in progress is for an older layout
+        self.fill_generation += 1
+        cells = self.getPaintOrder()
+        self.warmImageCache(self.item_grid.visibleCells())
+        for (x, y) in cells:
+            self.renderCell(x, y)
+        if self.filling:
+            self.finishFill()
+
+    def paintExposedCells(self, cells):
+        # Cells scrolled into view on a virtual grid
+        self.warmImageCache(cells)
+        for (x, y) in cells:
+            self.renderCell(x, y)
+
+    def paintDirtyCell(self, x, y):
+        items = self.state.items
+        if y < len(items) and x < len(items[y]):
+            self.renderCell(x, y)
+
+    def warmImageCache(self, cells):
+        # Render every missing image for a full rebuild in per-sprite batches
+        from composite import renderItemBatch, groupRenderKeys
+        from PIL import ImageTk
+
+        if self.image_scale.get() != self.cached_scale:
+            self.invalidateImageCache()
         items = self.state.items
-        for y in range(len(items)):
-            for x in range(len(items[y])):
-                item = items[y][x]
-                new_image = item.get_image_path()
-                new_num = self.getItemNum(item)
-                self.createItemButton(new_image, x, y, new_num, item.itemText, item.isDark())
+        keys = [self.getRenderKey(items[y][x]) for (x, y) in cells]
+        missing = [key for key in keys if self.image_cache.get(key) is None]
+        for (filepath, scale), variants in groupRenderKeys(missing).items():
+            for variant, img in zip(variants, renderItemBatch(self.atlas, filepath, scale, variants)):
+                self.image_cache.put((filepath, scale) + variant, ImageTk.PhotoImage(img))
+
+    def fillCells(self, generation, cells, start):
+        if generation != self.fill_generation:
+            return
+
+        deadline = time.perf_counter() + FILL_BUDGET
+        while start < len(cells) and time.perf_counter() < deadline:
+            self.renderCell(*cells[start])
+            start += 1
+
+        if start < len(cells):
+            self.root.after(1, self.fillCells, generation, cells, start)
+            return
+
+        self.finishFill()
+
+    def finishFill(self):
+        self.filling = False
+        self.placeholder = None
+        if self.on_first_paint:
+            self.on_first_paint()
+            self.on_first_paint = None
+        self.prerenderImages()
+
+    def renderCell(self, x, y):
+        item = self.state.items[y][x]
+        if self.item_grid.isVisible(x, y):
+            photo = self.getItemPhoto(item)
+            with timed('grid'):
+                self.item_grid.render(x, y, photo, item.itemText)
+        if self.stream_server:
+            self.stream_server.publishCell(x, y, self.describeCell(item))
+
+    def describeCell(self, item):
+        (image, scale, badge, isDark) = self.getRenderKey(item)
+        overlay = self.stream_server.getBadgePath(badge) if badge else None
+
+        return { 'image': image, 'overlay': overlay, 'dark': isDark, 'text': item.itemText }
+
+    def countWidgets(self, widget=None):
+        # Total number of widgets under the root, used to check that
+        # repeated state changes don't leak widgets
+        if widget is None:
+            widget = self.root
+        children = widget.winfo_children()
+
+        return len(children) + sum(self.countWidgets(child) for child in children)
 
     def getItemNum(self, item):
         if isinstance(item, NumberedItem):
@@ -116,63 +417,275 @@ class Tracker:
 
         return new_num
 
-    def createItemButton(self, filepath, x, y, new_num, itemText, isDark):
-        img = self.constructImage(filepath, x, y, new_num, isDark)
-        photo = ImageTk.PhotoImage(img)
+    def getRenderKey(self, item):
+        badge = getBadgeName(self.getItemNum(item), getattr(item, 'max_num', None))
+
+        return (item.get_image_path(), self.image_scale.get(), badge, item.isDark())
+
+    def getItemPhoto(self, item):
+        if self.image_scale.get() != self.cached_scale:
+            self.invalidateImageCache()
+
+        key = self.getRenderKey(item)
+        photo = self.image_cache.get(key)
+        if photo is None:
+            from PIL import ImageTk
+
+            img = renderItemImage(self.atlas, *key)
+            with timed('photoimage'):
+                photo = ImageTk.PhotoImage(img)
+            self.image_cache.put(key, photo)
+
+        return photo
+
+    def invalidateImageCache(self):
+        self.image_cache.clear()
+        self.cached_scale = self.image_scale.get()
+
+    def rescaleImages(self):
+        if self.settle_job is not None:
+            self.root.after_cancel(self.settle_job)
+            self.settle_job = None
+        if self.image_scale.get() != self.cached_scale:
+            self.prerenderImages()
+
+    def onScaleDrag(self):
+        # Coalesce motion events into at most one preview per frame
+        if self.preview_job is None:
+            self.preview_job = self.root.after(PREVIEW_FRAME_MS, self.previewScale)
+
+        # Refine with full quality images once the drag settles
+        if self.settle_job is not None:
+            self.root.after_cancel(self.settle_job)
+        self.settle_job = self.root.after(SETTLE_DELAY_MS, self.rescaleImages)
+
+    def previewScale(self):
+        self.preview_job = None
+        scale = self.image_scale.get()
+        if scale == self.cached_scale:
+            self.constructItemButtons()
+            return
+        if scale != self.preview_scale:
+            self.preview_cache.clear()
+            self.preview_scale = scale
+            self.preview_cursor = 0
+
+        items = self.state.items
+        self.item_grid.layout(tuple(len(row) for row in items), scale)
+        cells = self.item_grid.visibleCells()
+
+        # Paint as many cells as fit in the frame budget, and pick up where
+        # we left off on the next frame
+        start = time.perf_counter()
+        while self.preview_cursor < len(cells):
+            (x, y) = cells[self.preview_cursor]
+            item = items[y][x]
+            self.item_grid.render(x, y, self.getPreviewPhoto(item), item.itemText)
+            self.preview_cursor += 1
+            if time.perf_counter() - start > PREVIEW_BUDGET:
+                break
+
+        if self.preview_cursor < len(cells):
+            self.preview_job = self.root.after(PREVIEW_FRAME_MS, self.previewScale)
+        else:
+            self.preview_cursor = 0
 
-        label = Label(self.root, image=photo)
-        label.image = photo
-        label.grid(row=y + self.titleBarHeight, column=x)
-        label.configure(bg=self.config["Background"], activebackground=self.config["Focus"],
-                        highlightthickness=0)
+    def getPreviewPhoto(self, item):
+        key = self.getRenderKey(item)
+        photo = self.image_cache.get(key) or self.preview_cache.get(key)
+        if photo is None:
+            from PIL import ImageTk, Image
 
-        button = Button(self.root, image=photo, text=itemText, compound='top')
-        button.bind('<Button-1>', lambda event, x=x, y=y: self.forwardState(x, y))  # Left click
-        button.bind('<Button-3>', lambda event, x=x, y=y: self.backwardState(x, y)) # Right click
-        button.grid(row=y + self.titleBarHeight, column=x, sticky='NSEW')
-        button.configure(fg=self.config["ForegroundAlt"], activeforeground=self.config["ForegroundAlt"],
-                         bg=self.config["Background"], activebackground=self.config["Focus"],
-                         highlightthickness=0, bd=0, font=TRACKER_FONT)
+            photo = ImageTk.PhotoImage(renderItemImage(self.atlas, *key, resample=Image.NEAREST))
+            self.preview_cache[key] = photo
+
+        return photo
+
+    def prerenderImages(self):
+        # Render every state of every item at the current scale on the worker
+        # pool, so later clicks at this scale are just cache lookups
+        keys = []
+        for row in self.state.items:
+            for item in row:
+                variant = item.detach()
+                for _ in range(variant.state_count()):
+                    keys.append(self.getRenderKey(variant))
+                    variant.next_state()
+        self.prerenderer.start(keys, self.swapPrerenderedImages)
+
+    def swapPrerenderedImages(self, images):
+        from PIL import ImageTk
+
+        scale = self.image_scale.get()
+        if any(key[1] != scale for key in images):
+            # The scale moved on while rendering, a newer batch is coming
+            return
+
+        if scale != self.cached_scale:
+            self.invalidateImageCache()
+        for key, img in images.items():
+            self.image_cache.put(key, ImageTk.PhotoImage(img))
+        self.preview_cache.clear()
+        self.preview_scale = None
+        self.constructItemButtons()
 
     def constructImage(self, filepath, x, y, new_num, isDark):
-        img = Image.open(filepath)
-        img = img.resize((self.image_scale.get(), self.image_scale.get()),
-                         Image.ANTIALIAS)
-
-        # Handle wallets as a special case
-        if 'wallet' in filepath:
-            return img
-
-        if new_num:
-            if new_num == -1:
-                max_num = self.state.items[y][x].max_num
-                num_img = Image.open(f'{COUNTS_DIR}{max_num}max.png')
-            else:
-                num_img = Image.open(f'{COUNTS_DIR}{new_num}.png')
-            num_img = num_img.resize((self.image_scale.get(), self.image_scale.get()),
-                                     Image.ANTIALIAS)
-            img.paste(num_img, (0, 0), num_img)
-        if isDark:
-            darken = ImageEnhance.Brightness(img)
-            img = darken.enhance(DARKEN_FACTOR)
+        max_num = getattr(self.state.items[y][x], 'max_num', None)
+        badge = getBadgeName(new_num, max_num)
 
-        return img
+        return renderItemImage(self.atlas, filepath, self.image_scale.get(), badge, isDark)
 
     def forwardState(self, x, y):
-        items = self.state.items
-        item = items[y][x]
-        item.next_state()
-        new_image = item.get_image_path()
-        new_num = self.getItemNum(item)
-        self.createItemButton(new_image, x, y, new_num, item.itemText, item.isDark())
+        if self.replay:
+            return
+        with timed('click'):
+            items = self.state.items
+            item = items[y][x]
+            before = item.value
+            with timed('state'):
+                item.next_state()
+            self.history.record(('value', x, y, before, item.value))
+            self.journal.recordNext(x, y)
+            if self.recorder:
+                self.recorder.recordValue(x, y, item.value)
+            self.repaint.markCell(x, y)
 
     def backwardState(self, x, y):
-        items = self.state.items
-        item = items[y][x]
-        item.prev_state()
-        new_image = item.get_image_path()
-        new_num = self.getItemNum(item)
-        self.createItemButton(new_image, x, y, new_num, item.itemText, item.isDark())
+        if self.replay:
+            return
+        with timed('click'):
+            items = self.state.items
+            item = items[y][x]
+            before = item.value
+            with timed('state'):
+                item.prev_state()
+            self.history.record(('value', x, y, before, item.value))
+            self.journal.recordPrev(x, y)
+            if self.recorder:
+                self.recorder.recordValue(x, y, item.value)
+            self.repaint.markCell(x, y)
+
+    def toggleLatencyOverlay(self):
+        if self.latency_overlay is not None:
+            self.latency_overlay.destroy()
+            self.latency_overlay = None
+            return
+
+        self.latency_overlay = Toplevel(self.root)
+        self.latency_overlay.title('midna - Latency')
+        self.latency_overlay.protocol('WM_DELETE_WINDOW', self.toggleLatencyOverlay)
+        label = self.themed(Label(self.latency_overlay, justify=LEFT, anchor='nw', font=TRACKER_FONT),
+                            fg='Foreground', bg='Background')
+        label.pack(fill=BOTH, expand=True)
+        self.refreshLatencyOverlay(label)
+
+    def refreshLatencyOverlay(self, label):
+        if self.latency_overlay is None or not label.winfo_exists():
+            return
+        label.configure(text=formatReport())
+        self.root.after(LATENCY_REFRESH_MS, self.refreshLatencyOverlay, label)
+
+    def toggleReplay(self):
+        if self.replay:
+            self.closeReplay()
+            return
+
+        filepath = askopenfilename(initialdir=RUNS_DIR, filetypes=RUN_FILETYPES)
+        if not filepath:
+            return
+        try:
+            reader = RunReader(filepath)
+        except (OSError, RunFormatError) as error:
+            showerror('Invalid Run', str(error))
+            return
+
+        # The live state is put back when replay closes
+        self.replay = {
+                       'reader': reader,
+                       'live': self.state.snapshot(),
+                       'time': 0,
+                       'target': None,
+                       'window': Toplevel(self.root)
+                      }
+        window = self.replay['window']
+        window.title(f'midna - Replay {os.path.basename(filepath)}')
+        window.protocol('WM_DELETE_WINDOW', self.closeReplay)
+        window.bind('<Left>', lambda event: self.stepReplay(-1))
+        window.bind('<Right>', lambda event: self.stepReplay(1))
+        window.bind('<F5>', lambda event: self.closeReplay())
+
+        timeline = self.themed(Scale(window, orient=HORIZONTAL, bd=0, from_=0, to=reader.duration,
+                                     showvalue=0, resolution=1, length=400, highlightthickness=0,
+                                     command=lambda value: self.scrubReplay(int(float(value)))),
+                               bg='Accent1', troughcolor='Accent4', activebackground='Focus')
+        timeline.grid(row=0, column=0, columnspan=3, sticky='NSEW')
+        back = self.themed(Button(window, text='<', font=TRACKER_FONT, command=lambda: self.stepReplay(-1)),
+                           fg='Foreground', bg='Accent1', activeforeground='Foreground',
+                           activebackground='Focus')
+        back.grid(row=1, column=0, sticky='NSEW')
+        position = self.themed(Label(window, font=TRACKER_FONT), fg='ForegroundAlt', bg='Accent3')
+        position.grid(row=1, column=1, sticky='NSEW')
+        forward = self.themed(Button(window, text='>', font=TRACKER_FONT, command=lambda: self.stepReplay(1)),
+                              fg='Foreground', bg='Accent1', activeforeground='Foreground',
+                              activebackground='Focus')
+        forward.grid(row=1, column=2, sticky='NSEW')
+        window.columnconfigure(1, weight=1)
+        self.replay.update(timeline=timeline, position=position)
+
+        self.seekReplay(0)
+
+    def scrubReplay(self, time_ms):
+        # Slider drags fire far faster than seeks are worth doing, so only the
+        # latest position is seeked to once the UI is idle
+        if self.replay is None:
+            return
+        pending = self.replay['target'] is not None
+        if not pending and time_ms == self.replay['time']:
+            # Setting the slider after a step lands here too
+            return
+        self.replay['target'] = time_ms
+        if not pending:
+            self.root.after_idle(self.finishScrub)
+
+    def finishScrub(self):
+        if self.replay is None or self.replay['target'] is None:
+            return
+        time_ms = self.replay['target']
+        self.replay['target'] = None
+        self.seekReplay(time_ms)
+
+    def stepReplay(self, step):
+        # Jump to the previous or next recorded change
+        if self.replay is None:
+            return
+        reader = self.replay['reader']
+        self.seekReplay(reader.getEventTime(self.replay['time'], step))
+
+    def seekReplay(self, time_ms):
+        reader = self.replay['reader']
+        try:
+            reader.seek(self.state, time_ms)
+        except RunFormatError as error:
+            showerror('Invalid Run', str(error))
+            self.closeReplay()
+            return
+        self.replay['time'] = time_ms
+        self.replay['timeline'].set(time_ms)
+        self.replay['position'].configure(
+            text=f'{formatTime(time_ms)} / {formatTime(reader.duration)}')
+        self.constructItemButtons()
+
+    def closeReplay(self):
+        if self.replay is None:
+            return
+        (replay, self.replay) = (self.replay, None)
+        replay['window'].destroy()
+        self.state.restore(replay['live'])
+        self.constructItemButtons()
+
+    def dumpLatencies(self, path, interval_ms):
+        dumpReport(path)
+        self.root.after(interval_ms, self.dumpLatencies, path, interval_ms)
 
     def constructCommandButtons(self):
         items = self.state.items
@@ -184,7 +697,7 @@ class Tracker:
                         'row': len(items) + self.titleBarHeight,
                         'column': HALF_SPAN * 0,
                         'span': HALF_SPAN,
-                        'bg': self.config['Accent1']
+                        'bg': 'Accent1'
                     },
                     {
                         'text': 'Load State',
@@ -192,7 +705,7 @@ class Tracker:
                         'row': len(items) + self.titleBarHeight,
                         'column': HALF_SPAN * 1,
                         'span': HALF_SPAN,
-                        'bg': self.config['Accent1']
+                        'bg': 'Accent1'
                     },
                     {
                         'text': 'Save Template',
@@ -200,7 +713,7 @@ class Tracker:
                         'row': len(items) + self.titleBarHeight + 1,
                         'column': THIRD_SPAN * 0,
                         'span': THIRD_SPAN,
-                        'bg': self.config['Accent2']
+                        'bg': 'Accent2'
                     },
                     {
                         'text': 'Load Template',
@@ -208,7 +721,7 @@ class Tracker:
                         'row': len(items) + self.titleBarHeight + 1,
                         'column': THIRD_SPAN * 1,
                         'span': THIRD_SPAN,
-                        'bg': self.config['Accent2']
+                        'bg': 'Accent2'
                     },
                     {
                         'text': 'Clear Tracker',
@@ -216,57 +729,96 @@ class Tracker:
                         'row': len(items) + self.titleBarHeight + 1,
                         'column': THIRD_SPAN * 2,
                         'span': THIRD_SPAN,
-                        'bg': self.config['Accent2']
+                        'bg': 'Accent2'
                     }
                    ]
 
         for button in commands:
             self.createButton(self.root, button['text'], button['command'], button['row'],
-                              button['column'], button['span'], 'NSEW', self.config['Foreground'],
-                              button['bg'], self.config['Foreground'], self.config['Focus'])
+                              button['column'], button['span'], 'NSEW', 'Foreground',
+                              button['bg'], 'Foreground', 'Focus')
 
         self.commandRows = 2
         settings = self.createButton(self.root, 'Settings', self.openSettings,
                                      len(items) + self.titleBarHeight + self.commandRows, FULL_SPAN - 1, 1,
-                                     'NSEW', self.config['ForegroundAlt'], self.config['Accent3'],
-                                     self.config['Accent4'], self.config['ForegroundAlt'])
+                                     'NSEW', 'ForegroundAlt', 'Accent3', 'Accent4', 'ForegroundAlt')
 
     def createButton(self, master, text, command, row, column, span, sticky, fg, bg, afg, abg):
+        # The colors are config keys, so the button follows later theme changes
         button = Button(master, text=text, command=command)
         button.grid(row=row, column=column, columnspan=span, sticky=sticky)
-        button.configure(fg=fg, bg=bg, activeforeground=afg, activebackground=abg,
-                         highlightthickness=0, bd=0, font=TRACKER_FONT)
-
-        return button
+        button.configure(highlightthickness=0, bd=0, font=TRACKER_FONT)
+
+        return self.themed(button, fg=fg, bg=bg, activeforeground=afg, activebackground=abg)
+
+    def themed(self, widget, **options):
+        # Color widget options from config keys and remember them for recoloring
+        widget.configure(**{option: self.config[key] for option, key in options.items()})
+        self.themed_widgets.append((widget, options))
+
+        return widget
+
+    def recolorWidgets(self, changed):
+        alive = []
+        for widget, options in self.themed_widgets:
+            if not widget.winfo_exists():
+                continue
+            alive.append((widget, options))
+            updates = {option: self.config[key] for option, key in options.items() if key in changed}
+            if updates:
+                widget.configure(**updates)
+        self.themed_widgets = alive
+        self.item_grid.config = self.config
+        self.item_grid.recolor()
 
     def saveStateToFile(self, filepath=None):
+        if self.replay:
+            # The items hold a point in the replayed run, not this one
+            return
         if not filepath:
             filepath = asksaveasfilename(initialfile='state.json', defaultextension='.json',
-                                         filetypes=[('JSON File','*.json'),('All Files','*.*')])
+                                         filetypes=STATE_FILETYPES)
             if not filepath:
                 # User canceled out of menu
                 return
 
+        # Serialized and written on the background writer
         tracker_state = self.state.serializeState()
+        self.writer.submit(filepath, lambda: encodeStateFile(filepath, tracker_state))
 
-        with open(filepath, 'w') as outfile:
-            json.dump(tracker_state, outfile, indent=4)
+    def checkWriteErrors(self):
+        for path, error in self.writer.takeErrors():
+            showerror('Save Failed', f'Could not write {path}: {error}')
+        if self.recorder and self.recorder.error:
+            showerror('Recording Stopped', f'Could not record the rest of this run: {self.recorder.error}')
+            self.recorder = None
+        self.root.after(WRITE_ERROR_POLL_MS, self.checkWriteErrors)
 
     def loadStateFromFile(self):
-        filepath = askopenfilename(defaultextension='.json',
-                                   filetypes=[('JSON File','*.json'),('All Files','*.*')])
+        if self.replay:
+            return
+        filepath = askopenfilename(defaultextension='.json', filetypes=STATE_FILETYPES)
         if not filepath:
             return
 
-        with open(filepath) as infile:
-            tracker_state = json.load(infile)
-            state_items = tracker_state['items']
-
-            self.state.updateItems(state_items)
+        before = self.state.snapshot()
+        try:
+            tracker_state = loadStateFile(filepath)
+            # Leaves the current items alone if the file has invalid ones
+            self.state.updateItems(tracker_state['items'], tracker_state.get('types'))
+        except StateFormatError as error:
+            showerror('Invalid State File', str(error))
+            return
+        self.history.record(('snapshot', before, self.state.snapshot()))
+        self.journal.compact()
+        if self.recorder:
+            self.recorder.keyframe()
 
-            self.constructItemButtons()
+        self.constructItemButtons()
 
     def saveTemplate(self):
+        if self.replay:
+            return
         answer = askyesno(title='Overwrite Template?',
                           message='Are you sure that you want to overwrite the tracker template?')
 
@@ -282,45 +834,41 @@ class Tracker:
         menu_rows = 0
 
         # Colors
-        fg = self.config['Foreground']
-        fa = self.config['ForegroundAlt']
-        bg = self.config['Background']
-        fc = self.config['Focus']
-        a1 = self.config['Accent1']
-        a2 = self.config['Accent2']
-        a3 = self.config['Accent3']
-        a4 = self.config['Accent4']
-
-        color_header = Label(self.settings, text='Colors', fg=fa, bg=a3, font=TRACKER_FONT)
+        color_header = self.themed(Label(self.settings, text='Colors', font=TRACKER_FONT),
+                                   fg='ForegroundAlt', bg='Accent3')
         color_header.grid(row=menu_rows, column=0, columnspan=2, sticky='NSEW')
         menu_rows += 1
 
         colors = [
-                    { 'color': 'Foreground',    'hex': fg, 'fg': bg },
-                    { 'color': 'ForegroundAlt', 'hex': fa, 'fg': bg },
-                    { 'color': 'Background',    'hex': bg, 'fg': fg },
-                    { 'color': 'Focus',         'hex': fc, 'fg': fg },
-                    { 'color': 'Accent1',       'hex': a1, 'fg': fg },
-                    { 'color': 'Accent2',       'hex': a2, 'fg': fg },
-                    { 'color': 'Accent3',       'hex': a3, 'fg': fg },
-                    { 'color': 'Accent4',       'hex': a4, 'fg': fg }
+                    { 'color': 'Foreground',    'fg': 'Background' },
+                    { 'color': 'ForegroundAlt', 'fg': 'Background' },
+                    { 'color': 'Background',    'fg': 'Foreground' },
+                    { 'color': 'Focus',         'fg': 'Foreground' },
+                    { 'color': 'Accent1',       'fg': 'Foreground' },
+                    { 'color': 'Accent2',       'fg': 'Foreground' },
+                    { 'color': 'Accent3',       'fg': 'Foreground' },
+                    { 'color': 'Accent4',       'fg': 'Foreground' }
                  ]
 
         for c in colors:
-            label = Label(self.settings, text=c['color'], fg=fg, bg=bg, font=TRACKER_FONT)
+            label = self.themed(Label(self.settings, text=c['color'], font=TRACKER_FONT),
+                                fg='Foreground', bg='Background')
             label.grid(row=menu_rows, column=0, sticky='NSEW')
-            button = self.createButton(self.settings, c['hex'], None, menu_rows, 1, 1, 'NSEW',
-                                       c['fg'], c['hex'], c['fg'], c['hex'])
+            button = self.createButton(self.settings, self.config[c['color']], None, menu_rows, 1, 1, 'NSEW',
+                                       c['fg'], c['color'], c['fg'], c['color'])
+            self.themed(button, text=c['color'])
             button.bind('<Button-1>', lambda event, b=button, c=c: self.changeColor(b, c['color']))
             menu_rows += 1
 
         # Miscellaneous
-        misc_header = Label(self.settings, text='Miscellaneous', fg=fa, bg=a3, font=TRACKER_FONT)
+        misc_header = self.themed(Label(self.settings, text='Miscellaneous', font=TRACKER_FONT),
+                                  fg='ForegroundAlt', bg='Accent3')
         misc_header.grid(row=menu_rows, column=0, columnspan=2, sticky='NSEW')
         menu_rows += 1
 
         # Default Image Size
-        size_label = Label(self.settings, text='Default Image Size', fg=fg, bg=bg, font=TRACKER_FONT)
+        size_label = self.themed(Label(self.settings, text='Default Image Size', font=TRACKER_FONT),
+                                 fg='Foreground', bg='Background')
         size_label.grid(row=menu_rows, column=0, sticky='NSEW')
         size_text = self.temp_config['DefaultImageSize']
         self.size_entry = Entry(self.settings, font=TRACKER_FONT)
@@ -335,17 +883,18 @@ class Tracker:
         self.size_entry.configure(validate='key', validatecommand=(val, '%P'))
 
         # Toggle Title Bar
-        title_label = Label(self.settings, text='Show Title Bar', fg=fg, bg=bg, font=TRACKER_FONT)
+        title_label = self.themed(Label(self.settings, text='Show Title Bar', font=TRACKER_FONT),
+                                  fg='Foreground', bg='Background')
         title_label.grid(row=menu_rows, column=0, sticky='NSEW')
         title_text = 'True' if self.temp_config['ShowTitleBar'] else 'False'
         title_button = self.createButton(self.settings, title_text, None,
-                                         menu_rows, 1, 1, 'NSEW', fg, a1, fg, fc)
+                                         menu_rows, 1, 1, 'NSEW', 'Foreground', 'Accent1', 'Foreground', 'Focus')
         title_button.bind('<Button-1>', lambda event, b=title_button: self.toggleTitleBar(b))
         menu_rows += 1
 
         # Apply Changes
         apply = self.createButton(self.settings, 'Apply Changes', self.applySettings,
-                                  menu_rows, 0, 2, 'NSEW', fa, a4, fa, a3)
+                                  menu_rows, 0, 2, 'NSEW', 'ForegroundAlt', 'Accent4', 'ForegroundAlt', 'Accent3')
         menu_rows += 1
 
         # Add weights
@@ -371,44 +920,99 @@ class Tracker:
         new_image_size = int(self.size_entry.get())
         if new_image_size in range(IMAGE_SCALE_MIN, IMAGE_SCALE_MAX + 1):
             self.temp_config['DefaultImageSize'] = new_image_size
-            self.config = self.temp_config
+            self.applyConfig(self.temp_config)
             self.writeConfigToFile()
-            self.settings.destroy()
-            self.build()
-            self.openSettings()
+            self.temp_config = copy.deepcopy(self.config)
         else:
             showerror('Invalid Image Size',
                      f'Default Image Size value of {new_image_size} is invalid. '
                    + f'Please enter a value between {IMAGE_SCALE_MIN} and {IMAGE_SCALE_MAX}.')
 
+    def applyConfig(self, new_config):
+        # Only apply the keys that changed. Colors are set on the existing
+        # widgets, only the title bar needs a rebuild, and DefaultImageSize
+        # takes effect on the next launch. Other keys are read at startup.
+        changed = {key for key in new_config.keys() | self.config.keys()
+                   if new_config.get(key) != self.config.get(key)}
+        self.config = new_config
+        if 'ShowTitleBar' in changed:
+            reopen = self.settings is not None and self.settings.winfo_exists()
+            self.build()
+            if reopen:
+                self.openSettings()
+        elif changed & set(COLOR_KEYS):
+            self.recolorWidgets(changed)
+
+        return changed
+
+    def getConfigStamp(self):
+        try:
+            stat = os.stat(CONFIG_FILE)
+        except OSError:
+            return None
+
+        return (stat.st_mtime_ns, stat.st_size)
+
+    def pollConfigFile(self):
+        # Hot-reload config.json when it is edited outside of the tracker
+        stamp = self.getConfigStamp()
+        if stamp != self.config_stamp and not self.writer.isPending(CONFIG_FILE):
+            try:
+                with open(CONFIG_FILE) as infile:
+                    new_config = json.load(infile)
+            except (OSError, ValueError):
+                # Missing or half written, try again on the next poll
+                new_config = None
+            if new_config is not None:
+                self.config_stamp = stamp
+                changed = self.applyConfig({**self.config, **new_config})
+                for key in changed:
+                    # Keep an open settings window from writing back stale values
+                    self.temp_config[key] = self.config[key]
+        self.root.after(CONFIG_POLL_MS, self.pollConfigFile)
+
     def writeConfigToFile(self):
-        with open('config.json', 'w') as outfile:
-            json.dump(self.config, outfile, indent=4)
+        config = dict(self.config)
+        self.writer.submit(CONFIG_FILE, lambda: json.dumps(config, indent=4).encode('utf-8'),
+                           self.onConfigWritten)
+
+    def onConfigWritten(self):
+        # Runs on the writer thread, keeps the hot-reload poll from reading
+        # back our own write
+        self.config_stamp = self.getConfigStamp()
 
     def clearTracker(self, fullWipe=False):
+        if self.replay:
+            return
+        before = self.state.snapshot()
         if fullWipe:
             self.state.fullWipe()
         else:
             self.state.reset()
+        self.history.record(('snapshot', before, self.state.snapshot()))
+        self.journal.compact()
+        if self.recorder:
+            self.recorder.keyframe()
         self.build()
 
     def constructSliders(self):
-        scale_label = Label(self.root, text='Image Size', fg=self.config["ForegroundAlt"],
-                            bg=self.config["Accent3"], font=TRACKER_FONT)
+        scale_label = self.themed(Label(self.root, text='Image Size', font=TRACKER_FONT),
+                                  fg='ForegroundAlt', bg='Accent3')
         scale_label.grid(row=(len(self.state.items) + self.titleBarHeight + self.commandRows),
                          column=0, columnspan=THIRD_SPAN, sticky='NSEW')
 
-        image_scaler = Scale(self.root, orient=HORIZONTAL, activebackground=self.config["ForegroundAlt"],
-                             fg=self.config["ForegroundAlt"], bg=self.config["Accent3"], bd=0,
-                             troughcolor=self.config["Accent4"], from_=IMAGE_SCALE_MIN, to=IMAGE_SCALE_MAX,
-                             showvalue=0, width=21, highlightthickness=0, variable=self.image_scale)
+        image_scaler = Scale(self.root, orient=HORIZONTAL, bd=0, from_=IMAGE_SCALE_MIN, to=IMAGE_SCALE_MAX,
+                             showvalue=0, width=21, highlightthickness=0, variable=self.image_scale,
+                             command=lambda value: self.onScaleDrag())
+        self.themed(image_scaler, activebackground='ForegroundAlt', fg='ForegroundAlt',
+                    bg='Accent3', troughcolor='Accent4')
         image_scaler.grid(row=(len(self.state.items) + self.titleBarHeight + self.commandRows),
                                column=THIRD_SPAN, columnspan=HALF_SPAN, sticky='NSEW')
-        image_scaler.bind('<ButtonRelease-1>', lambda event: self.constructItemButtons())
+        image_scaler.bind('<ButtonRelease-1>', lambda event: self.rescaleImages())
 
     def configureRowsAndColumns(self):
         num_rows = len(self.state.items) + self.titleBarHeight + self.commandRows
-        num_cols = len(self.state.items[0])
+        num_cols = self.item_grid.columnCount()
 
         for i in range(1, num_rows - 2):
             self.root.grid_rowconfigure(i, weight=1)
@@ -417,19 +1021,25 @@ class Tracker:
 
 class State:
     def __init__(self, defaults):
-        self.defaults = defaults
+        (self.defaults, self.default_values) = packItems(defaults)
         self.reset()
 
     def reset(self):
-        self.items = copy.deepcopy(self.defaults)
+        self.values = array(VALUE_TYPE, self.default_values)
+        self.items = rebindItems(self.defaults, self.values)
 
     def fullWipe(self):
-        for row in self.items:
-            for item in row:
-                if isinstance(item, ProgressiveItem) or isinstance(item, ToggleItem):
-                    item.current_state = 0
-                elif isinstance(item, NumberedItem):
-                    item.current_num = 0
+        self.values[:] = array(VALUE_TYPE, [0]) * len(self.values)
+
+    def snapshot(self):
+        # Item records are never mutated, only their values, so a snapshot
+        # shares them and copies just the row lists and the value buffer
+        return ([list(row) for row in self.items], array(VALUE_TYPE, self.values))
+
+    def restore(self, snapshot):
+        (items, values) = snapshot
+        self.values = array(VALUE_TYPE, values)
+        self.items = rebindItems(items, self.values)
 
     def serializeState(self):
         item_states = []
@@ -442,8 +1052,8 @@ class State:
 
         return tracker_state
 
-    def updateItems(self, new_items):
-        self.items = copy.deepcopy(convertJSONtoItems(new_items))
+    def updateItems(self, new_items, types=None):
+        (self.items, self.values) = buildItems(new_items, types)
 
-    def updateDefaults(self, new_defaults):
-        self.defaults = copy.deepcopy(convertJSONtoItems(new_defaults))
+    def updateDefaults(self, new_defaults, types=None):
+        (self.defaults, self.default_values) = buildItems(new_defaults, types)
@@ -0,0 +1,106 @@
+import os
+import queue
+import tempfile
+import threading
+
+def writeFileAtomic(path, data):
+    # Write next to the target, fsync, then rename over it. A crash at any
+    # point leaves either the old file or the new one, never a truncated one.
+    directory = os.path.dirname(os.path.abspath(path))
+    try:
+        mode = os.stat(path).st_mode & 0o777
+    except FileNotFoundError:
+        mode = 0o644
+    (fd, temp_path) = tempfile.mkstemp(dir=directory, prefix=f'.{os.path.basename(path)}.', suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'wb') as outfile:
+            outfile.write(data)
+            outfile.flush()
+            os.fsync(outfile.fileno())
+        os.chmod(temp_path, mode)
+        os.replace(temp_path, path)
+    except BaseException:
+        try:
+            os.remove(temp_path)
+        except OSError:
+            pass
+        raise
+
+    if os.name == 'posix':
+        # Make the rename itself durable
+        dir_fd = os.open(directory, os.O_RDONLY)
+        try:
+            os.fsync(dir_fd)
+        except OSError:
+            pass
+        finally:
+            os.close(dir_fd)
+
+class BackgroundWriter:
+    # Writes files on one daemon thread. Callers take a snapshot of their data
+    # on the Tk thread and pass a function that encodes it, so serializing and
+    # disk I/O stay off the UI. A newer request for a path that hasn't been
+    # written yet replaces the older one, so bursts of saves cost one write.
+    def __init__(self):
+        self.pending = {}
+        self.writing = None
+        self.closed = False
+        self.thread = None
+        self.condition = threading.Condition()
+        self.errors = queue.SimpleQueue()
+
+    def submit(self, path, encode, done=None):
+        with self.condition:
+            self.pending[path] = (encode, done)
+            if self.thread is None or not self.thread.is_alive():
+                self.thread = threading.Thread(target=self.run, name='midna-writer', daemon=True)
+                self.thread.start()
+            self.condition.notify_all()
+
+    def run(self):
+        while True:
+            with self.condition:
+                while not self.pending and not self.closed:
+                    self.condition.wait()
+                if not self.pending:
+                    return
+                path = next(iter(self.pending))
+                (encode, done) = self.pending.pop(path)
+                self.writing = path
+
+            try:
+                writeFileAtomic(path, encode())
+                if done is not None:
+                    done()
+            except Exception as error:
+                # Any failure is reported, a dead writer would leave every
+                # later save queued and flush() waiting forever
+                self.errors.put((path, error))
+            finally:
+                with self.condition:
+                    self.writing = None
+                    self.condition.notify_all()
+
+    def isPending(self, path):
+        with self.condition:
+            return path in self.pending or self.writing == path
+
+    def flush(self):
+        with self.condition:
+            while self.pending or self.writing is not None:
+                self.condition.wait()
+
+    def takeErrors(self):
+        errors = []
+        while not self.errors.empty():
+            errors.append(self.errors.get())
+
+        return errors
+
+    def shutdown(self):
+        self.flush()
+        with self.condition:
+            self.closed = True
+            self.condition.notify_all()
+        if self.thread is not None:
+            self.thread.join()